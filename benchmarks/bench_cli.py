@@ -0,0 +1,65 @@
+"""Benchmark invocations of the CLI, against a local fake GBFS server.
+
+Measures the wall time of importing the CLI, and of whole `bysykkel list` invocations in a new process,
+like scripts which call the CLI in a loop do.
+
+Usage:
+    python benchmarks/bench_cli.py [--stations 270] [--repeat 10] [-- extra list arguments]
+
+The results are stored in `benchmarks/results/cli.jsonl`, see `benchmarks/results.py`.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+from typing import List
+
+import results
+from fake_gbfs import fake_gbfs
+
+
+def time_command(command: List[str], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "list_args", nargs="*", help="Extra arguments to `bysykkel list`"
+    )
+    args = parser.parse_args()
+
+    with fake_gbfs(args.stations) as base_url:
+        commands = {
+            "import": [sys.executable, "-c", "import bysykkel.cli.main"],
+            "list": [
+                sys.executable,
+                "-m",
+                "bysykkel.cli.main",
+                f"--base-url={base_url}",
+                "list",
+                *args.list_args,
+            ],
+        }
+        print(f"CLI with {args.stations} stations:")
+        timings = {}
+        for name, command in commands.items():
+            invocations = time_command(command, args.repeat)
+            timings[f"{name}_median_ms"] = statistics.median(invocations) * 1000
+            print(f"  {name:<8} median {timings[f'{name}_median_ms']:8.2f} ms")
+
+    params = {"stations": args.stations, "list_args": args.list_args}
+    results.store("cli", params, timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark `BysykkelClient.get_stations()` against a local fake GBFS server.
+
+Measures the full query path (HTTP, parsing and merging) when the status feed changes on every query,
+and when neither feed changed, i.e. the server answers `304 Not Modified` and the previous responses are reused.
+
+Usage:
+    python benchmarks/bench_client.py [--stations 270] [--repeat 50] [--latency 0]
+
+The results are stored in `benchmarks/results/client.jsonl`, see `benchmarks/results.py`.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+from time import perf_counter
+from typing import List
+
+from bysykkel.client import BysykkelClient
+
+import results
+from fake_gbfs import fake_gbfs
+
+
+async def time_queries(base_url: str, repeat: int) -> List[float]:
+    client = BysykkelClient(base_url)
+    try:
+        await client.get_stations()  # Warm up the connections
+        timings = []
+        for _ in range(repeat):
+            start = perf_counter()
+            await client.get_stations()
+            timings.append(perf_counter() - start)
+        return timings
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake server delays every response",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"get_stations() with {args.stations} stations:")
+    timings = {}
+    # The status feed changes on every query, or not at all
+    for name, update_interval in (("changed", 0), ("unchanged", 3600)):
+        with fake_gbfs(args.stations, args.latency, update_interval) as base_url:
+            queries = asyncio.run(time_queries(base_url, args.repeat))
+        timings[f"{name}_median_ms"] = statistics.median(queries) * 1000
+        timings[f"{name}_min_ms"] = min(queries) * 1000
+        print(
+            f"  {name:<10} median {timings[f'{name}_median_ms']:8.2f} ms, min {timings[f'{name}_min_ms']:8.2f} ms"
+        )
+    params = {"stations": args.stations, "latency": args.latency}
+    results.store("client", params, timings)
+
+
+if __name__ == "__main__":
+    main()
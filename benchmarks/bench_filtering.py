@@ -0,0 +1,72 @@
+"""Benchmark filtering one snapshot of stations, like the `/v1/stations` filters do.
+
+Compares evaluating compiled filters over the columns of a snapshot (as `/v1/stations` does),
+with evaluating them station by station, for a few typical queries.
+
+Usage:
+    python benchmarks/bench_filtering.py [--stations 270] [--repeat 20]
+
+The results are stored in `benchmarks/results/filtering.jsonl`, see `benchmarks/results.py`.
+"""
+
+import argparse
+import logging
+import timeit
+
+from bysykkel.app.rendering import render_stations
+from bysykkel.cache import build_snapshot
+from bysykkel.client import BysykkelClient
+from bysykkel.filters import compile_filter
+from bysykkel.parsing import loads, parse_station_information, parse_station_status
+
+import results
+from fake_gbfs import ORIGIN, station_information, station_status
+
+QUERIES = {
+    "bikes": (("num_bikes_available", ">=5"),),
+    "renting_docks": (("is_renting", "true"), ("num_docks_available", "1..10")),
+    "capacity_in": (("capacity", "12,24,36"),),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    client = BysykkelClient("http://localhost")
+    snapshot = build_snapshot(
+        client,
+        parse_station_status(loads(station_status(args.stations))),
+        parse_station_information(loads(station_information(args.stations))),
+        default_ttl=10,
+    )
+    columns, stations = snapshot.columns, snapshot.stations
+    bbox = (ORIGIN[0] - 0.01, ORIGIN[1] - 0.02, ORIGIN[0] + 0.01, ORIGIN[1] + 0.02)
+
+    benchmarks = {}
+    for name, query in QUERIES.items():
+        station_filter = compile_filter(query)
+        benchmarks[f"{name}_columns"] = lambda f=station_filter: f.rows(columns)
+        benchmarks[f"{name}_stations"] = lambda f=station_filter: [
+            station for station in stations if f(station)
+        ]
+        benchmarks[f"{name}_render"] = lambda f=station_filter: render_stations(
+            stations.rows(f.iter_rows(columns))
+        )
+    benchmarks["bbox"] = lambda: snapshot.spatial.within(*bbox)
+    benchmarks["compile"] = lambda: compile_filter.__wrapped__(QUERIES["renting_docks"])
+
+    print(f"Filtering one snapshot with {args.stations} stations:")
+    timings = {}
+    for name, benchmark in benchmarks.items():
+        best = min(timeit.repeat(benchmark, number=1, repeat=args.repeat))
+        timings[f"{name}_ms"] = best * 1000
+        print(f"  {name:<22} {best * 1000:8.3f} ms")
+    results.store("filtering", {"stations": args.stations}, timings)
+
+
+if __name__ == "__main__":
+    main()
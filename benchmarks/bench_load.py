@@ -0,0 +1,178 @@
+"""Load test the REST API, against a local fake GBFS server.
+
+Starts a fake GBFS server and the REST API in separate processes (unless `--url` is given),
+then sends as many requests as possible over `--connections` concurrent connections for `--duration` seconds
+to each of the routes, and reports the throughput and the 50th and 99th percentile latencies.
+The load generator runs in a single process, so for many workers it may be the bottleneck.
+
+Usage:
+    python benchmarks/bench_load.py [--stations 270] [--duration 10] [--connections 16] [--workers 1] [--no-poller]
+    python benchmarks/bench_load.py --url http://127.0.0.1:8000
+
+The results are stored in `benchmarks/results/load.jsonl`, see `benchmarks/results.py`.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List
+
+import httpx
+
+import results
+from fake_gbfs import fake_gbfs, free_port, wait_until_up
+
+ROUTES: Dict[str, Callable[[int], str]] = {
+    "stations": lambda n_stations: "/v1/stations",
+    "stations_filtered": lambda n_stations: "/v1/stations?num_bikes_available=>=5&fields=station_id,num_bikes_available",
+    "station": lambda n_stations: f"/v1/station/{random.randrange(n_stations)}",
+}
+
+
+@contextmanager
+def api(base_url: str, workers: int, poller: bool) -> Iterator[str]:
+    """Run the REST API in a separate process, querying the GBFS server at `base_url`, and get its URL."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "BYSYKKEL_OSLOBYSYKKEL_APIURL": base_url,
+        "BYSYKKEL_PORT": str(port),
+        "BYSYKKEL_WORKERS": str(workers),
+        "BYSYKKEL_POLLER_ENABLED": str(poller).lower(),
+        "BYSYKKEL_GBFS_DISCOVERY": "false",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bysykkel.app.main"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(f"{url}/ready")
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def load(
+    url: str, path: Callable[[], str], duration: float, connections: int
+) -> Dict[str, float]:
+    """Send requests over `connections` concurrent connections for `duration` seconds."""
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(client: httpx.AsyncClient, deadline: float) -> None:
+        nonlocal errors
+        while perf_counter() < deadline:
+            start = perf_counter()
+            try:
+                response = await client.get(path())
+                response.read()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if response.is_success:
+                latencies.append(perf_counter() - start)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        await client.get(path())  # Warm up
+        start = perf_counter()
+        await asyncio.gather(
+            *(worker(client, start + duration) for _ in range(connections))
+        )
+        elapsed = perf_counter() - start
+
+    percentiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+    )
+    return {
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--no-poller",
+        dest="poller",
+        action="store_false",
+        help="Fetch from upstream on the request path, instead of polling in the background",
+    )
+    parser.add_argument(
+        "--update-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between station status updates of the fake GBFS server",
+    )
+    parser.add_argument(
+        "--url", help="Load test an already running REST API at this URL instead"
+    )
+    parser.add_argument(
+        "--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES)
+    )
+    args = parser.parse_args()
+
+    with (
+        nullcontext(None)
+        if args.url
+        else fake_gbfs(args.stations, 0, args.update_interval)
+    ) as base_url:
+        with (
+            nullcontext(args.url)
+            if args.url
+            else api(base_url, args.workers, args.poller)
+        ) as url:
+            print(
+                f"Load test of {url} with {args.connections} connections for {args.duration} seconds per route:"
+            )
+            timings = {}
+            for name in args.routes:
+                route = ROUTES[name]
+                result = asyncio.run(
+                    load(
+                        url,
+                        lambda: route(args.stations),
+                        args.duration,
+                        args.connections,
+                    )
+                )
+                print(
+                    f"  {name:<18} {result['requests_per_second']:8.1f} req/s"
+                    f", p50 {result['p50_ms']:7.2f} ms, p99 {result['p99_ms']:7.2f} ms"
+                    f", {result['errors']} errors"
+                )
+                timings.update(
+                    {f"{name}_{key}": value for key, value in result.items()}
+                )
+
+    params = {
+        "stations": args.stations,
+        "connections": args.connections,
+        "workers": args.workers,
+        "poller": args.poller,
+        "update_interval": args.update_interval,
+        "url": args.url,
+    }
+    results.store("load", params, timings)
+
+
+if __name__ == "__main__":
+    main()
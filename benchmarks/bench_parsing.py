@@ -0,0 +1,71 @@
+"""Benchmark the cost of parsing and merging one snapshot of the station feeds.
+
+Compares validating both feeds and the merged stations with pydantic (as `BysykkelClient` used to),
+with the fast parsers in `bysykkel.parsing` and `BysykkelClient.merge_stations()`.
+
+Usage:
+    python benchmarks/bench_parsing.py [--stations 270] [--repeat 20]
+
+The results are stored in `benchmarks/results/parsing.jsonl`, see `benchmarks/results.py`.
+"""
+
+import argparse
+import json
+import logging
+import timeit
+from typing import List
+
+from pydantic import parse_obj_as
+
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationData, StationInfoResponse, StationStatusReponse
+from bysykkel.parsing import loads, parse_station_information, parse_station_status
+
+import results
+from fake_gbfs import station_information, station_status
+
+
+def pydantic_snapshot(status_content: bytes, info_content: bytes) -> List[StationData]:
+    status = parse_obj_as(StationStatusReponse, json.loads(status_content))
+    info = parse_obj_as(StationInfoResponse, json.loads(info_content))
+    status_by_id = {entry.station_id: entry.dict() for entry in status.data.stations}
+    info_by_id = {entry.station_id: entry.dict() for entry in info.data.stations}
+    station_data = [
+        {**info_by_id[station_id], **status_by_id[station_id]}
+        for station_id in set(status_by_id).intersection(info_by_id)
+    ]
+    return parse_obj_as(List[StationData], station_data)
+
+
+def fast_snapshot(client: BysykkelClient, status_content: bytes, info_content: bytes):
+    status = parse_station_status(loads(status_content))
+    info = parse_station_information(loads(info_content))
+    return client.merge_stations(status, info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    client = BysykkelClient("http://localhost")
+    status_content = station_status(args.stations)
+    info_content = station_information(args.stations)
+
+    benchmarks = {
+        "pydantic": lambda: pydantic_snapshot(status_content, info_content),
+        "fast": lambda: fast_snapshot(client, status_content, info_content),
+    }
+    print(f"Parse + merge of one snapshot with {args.stations} stations:")
+    timings = {}
+    for name, benchmark in benchmarks.items():
+        best = min(timeit.repeat(benchmark, number=1, repeat=args.repeat))
+        timings[f"{name}_ms"] = best * 1000
+        print(f"  {name:<10} {best * 1000:8.2f} ms")
+    results.store("parsing", {"stations": args.stations}, timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Local fake GBFS server, serving realistic station feeds of any size for benchmarks.
+
+The stations are spread over a grid around Oslo, with varying capacities and availability,
+and with the extra fields the real feeds have, so parsers have the same unknown fields to skip.
+`station_status.json` changes every `update_interval` seconds (or on every request, if 0),
+cycling through a fixed number of pre-encoded versions, so serving it is cheap and doesn't skew benchmarks.
+Responses have `ETag` and `Last-Modified` headers, and conditional requests are answered with `304 Not Modified`.
+
+Usage:
+    python benchmarks/fake_gbfs.py [--stations 270] [--latency 0] [--update-interval 10] [--port 8799]
+
+Or from benchmarks, which runs the server in a separate process:
+    >>> with fake_gbfs(stations=10_000) as base_url:
+    ...     client = BysykkelClient(base_url)
+"""
+
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+LAST_UPDATED = 1553592653
+# Center of the grid of stations, and distance between neighbouring stations in degrees
+ORIGIN = (59.91, 10.75)
+SPACING = 0.002
+
+
+def station_information(
+    n_stations: int, last_updated: int = LAST_UPDATED, ttl: int = 10
+) -> bytes:
+    """Encode a `station_information.json` feed with `n_stations` stations."""
+    rng = random.Random(0)
+    side = max(int(n_stations**0.5), 1)
+    stations = [
+        {
+            "station_id": str(i),
+            "name": f"Station {i}",
+            "address": f"Street {i}",
+            "rental_uris": {
+                "android": f"oslobysykkel://stations/{i}",
+                "ios": f"oslobysykkel://stations/{i}",
+            },
+            "lat": round(ORIGIN[0] + (i // side - side / 2) * SPACING, 6),
+            "lon": round(ORIGIN[1] + (i % side - side / 2) * SPACING * 2, 6),
+            "capacity": rng.choice((12, 15, 18, 21, 24, 30, 36)),
+        }
+        for i in range(n_stations)
+    ]
+    body = {"last_updated": last_updated, "ttl": ttl, "data": {"stations": stations}}
+    return json.dumps(body).encode()
+
+
+def station_status(
+    n_stations: int, last_updated: int = LAST_UPDATED, ttl: int = 10, seed: int = 0
+) -> bytes:
+    """Encode a `station_status.json` feed with `n_stations` stations.
+
+    The availability of the stations depends on `seed`, so feeds with different seeds have different availability.
+    """
+    capacities = random.Random(0)
+    rng = random.Random(seed)
+    stations = []
+    for i in range(n_stations):
+        capacity = capacities.choice((12, 15, 18, 21, 24, 30, 36))
+        bikes = rng.randint(0, capacity)
+        stations.append(
+            {
+                "station_id": str(i),
+                "is_installed": 1,
+                "is_renting": int(rng.random() > 0.02),
+                "is_returning": int(rng.random() > 0.02),
+                "last_reported": last_updated - rng.randint(0, 600),
+                "num_bikes_available": bikes,
+                "num_docks_available": capacity - bikes,
+                "num_vehicles_available": bikes,
+                "vehicle_types_available": [
+                    {"vehicle_type_id": "bike", "count": bikes}
+                ],
+            }
+        )
+    body = {"last_updated": last_updated, "ttl": ttl, "data": {"stations": stations}}
+    return json.dumps(body).encode()
+
+
+def gbfs_discovery(base_url: str) -> bytes:
+    """Encode a GBFS v2 `gbfs.json` auto-discovery file for the feeds of the fake server."""
+    feeds = [
+        {"name": name, "url": f"{base_url}/{name}.json"}
+        for name in ("station_information", "station_status")
+    ]
+    body = {"last_updated": LAST_UPDATED, "ttl": 3600, "data": {"en": {"feeds": feeds}}}
+    return json.dumps(body).encode()
+
+
+class Feed:
+    """Pre-encoded versions of a feed, with validators for conditional requests."""
+
+    def __init__(self, versions: List[bytes]) -> None:
+        self.versions = versions
+        self.last_modified = [
+            formatdate(LAST_UPDATED + i, usegmt=True) for i in range(len(versions))
+        ]
+
+    def response(
+        self,
+        version: int,
+        if_none_match: Optional[str],
+        if_modified_since: Optional[str],
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        version %= len(self.versions)
+        headers = {"ETag": f'"{version}"', "Last-Modified": self.last_modified[version]}
+        if if_none_match == headers["ETag"] or (
+            if_none_match is None and if_modified_since == headers["Last-Modified"]
+        ):
+            return 304, headers, b""
+        return 200, headers, self.versions[version]
+
+
+class FakeGBFSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        n_stations: int,
+        latency: float = 0.0,
+        update_interval: float = 10.0,
+        n_versions: int = 8,
+        ttl: int = 10,
+    ) -> None:
+        super().__init__(address, FakeGBFSHandler)
+        self.latency = latency
+        self.update_interval = update_interval
+        self.base_url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        self.feeds = {
+            "/gbfs.json": Feed([gbfs_discovery(self.base_url)]),
+            "/station_information.json": Feed(
+                [station_information(n_stations, ttl=ttl)]
+            ),
+            "/station_status.json": Feed(
+                [
+                    station_status(n_stations, LAST_UPDATED + i, ttl=ttl, seed=i)
+                    for i in range(n_versions)
+                ]
+            ),
+        }
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        """Current version of the changing feeds."""
+        if self.update_interval > 0:
+            return int(time.time() / self.update_interval)
+        with self._lock:
+            self._requests += 1
+            return self._requests
+
+
+class FakeGBFSHandler(BaseHTTPRequestHandler):
+    server: FakeGBFSServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        feed = self.server.feeds.get(self.path)
+        if feed is None:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        code, headers, content = feed.response(
+            self.server.version(),
+            self.headers.get("If-None-Match"),
+            self.headers.get("If-Modified-Since"),
+        )
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30.0) -> None:
+    """Wait until `url` responds with a successful status code."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if httpx.get(url).is_success:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} isn't up after {timeout} seconds")
+        time.sleep(0.1)
+
+
+@contextmanager
+def fake_gbfs(
+    stations: int = 270, latency: float = 0.0, update_interval: float = 10.0
+) -> Iterator[str]:
+    """Run a fake GBFS server in a separate process, and get its base URL."""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__)),
+            f"--stations={stations}",
+            f"--latency={latency}",
+            f"--update-interval={update_interval}",
+            f"--port={port}",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(f"{base_url}/gbfs.json")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=270)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay every response"
+    )
+    parser.add_argument(
+        "--update-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between station status updates, or 0 to update on every request",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    server = FakeGBFSServer(
+        (args.host, args.port), args.stations, args.latency, args.update_interval
+    )
+    print(f"Serving {args.stations} stations on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Storage of benchmark results, for comparing runs across commits.
+
+Every run is appended as a JSON line to `benchmarks/results/<benchmark>.jsonl`,
+along with its parameters, the git commit and the Python version,
+and is compared against the previous run of the same benchmark with the same parameters.
+"""
+
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def git_revision() -> str:
+    try:
+        revision = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision.stdout.strip()
+
+
+def previous_result(
+    benchmark: str, params: Dict[str, Any], results_dir: Path = RESULTS_DIR
+) -> Optional[Dict[str, Any]]:
+    """Get the latest stored result of a benchmark run with the same parameters, if any."""
+    path = results_dir / f"{benchmark}.jsonl"
+    if not path.exists():
+        return None
+    previous = None
+    with path.open() as file:
+        for line in file:
+            result = json.loads(line)
+            if result["params"] == params:
+                previous = result
+    return previous
+
+
+def store(
+    benchmark: str,
+    params: Dict[str, Any],
+    results: Dict[str, float],
+    results_dir: Path = RESULTS_DIR,
+) -> None:
+    """Store the results of a benchmark run, and print how they compare to the previous run.
+
+    Args:
+        benchmark: Name of the benchmark, e.g. `parsing`.
+        params: Parameters of the run. Only runs with equal parameters are compared.
+        results: Measurements by name, e.g. `{"fast_ms": 1.2}`.
+    """
+    previous = previous_result(benchmark, params, results_dir)
+    if previous is not None:
+        print(f"Compared to {previous['revision']} ({previous['time']}):")
+        for name, value in results.items():
+            before = previous["results"].get(name)
+            if before:
+                print(
+                    f"  {name:<24} {before:10.2f} -> {value:10.2f} ({value / before - 1:+.1%})"
+                )
+
+    results_dir.mkdir(parents=True, exist_ok=True)
+    result = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    with (results_dir / f"{benchmark}.jsonl").open("a") as file:
+        file.write(json.dumps(result) + "\n")
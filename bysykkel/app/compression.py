@@ -0,0 +1,225 @@
+"""Negotiation of the `Content-Encoding` of responses, and compression of response bodies.
+
+gzip is always supported, while brotli (`br`) and Zstandard (`zstd`) require installing `bysykkel[compression]`.
+Bodies which are cached per snapshot are compressed once with `compress()`, at a higher level than
+the bodies which `CompressionMiddleware` compresses on every request.
+
+References:
+    Accept-Encoding: https://www.rfc-editor.org/rfc/rfc9110#name-accept-encoding
+    Zstandard content coding: https://www.rfc-editor.org/rfc/rfc8878#name-content-encoding
+"""
+
+import gzip
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+# Supported content codings, by preference when the client accepts several of them equally.
+ENCODINGS: List[str] = [
+    coding
+    for coding, module in (("zstd", zstandard), ("br", brotli), ("gzip", gzip))
+    if module is not None
+]
+# Compression levels of cached bodies, and of bodies compressed per request.
+# Brotli's and Zstandard's maximum levels are too slow for large bodies, even once per snapshot.
+CACHED_LEVELS = {"zstd": 10, "br": 9, "gzip": 9}
+PER_REQUEST_LEVELS = {"zstd": 3, "br": 5, "gzip": 6}
+
+
+def negotiate(
+    accept_encoding: str, encodings: Sequence[str] = ENCODINGS
+) -> Optional[str]:
+    """Pick the supported content coding preferred by an `Accept-Encoding` header, or `None` to not compress.
+
+    Codings are ranked by their `q` values, and ties are broken by the order of `encodings`.
+
+    Example:
+        >>> negotiate("gzip, br;q=0.5")
+        'gzip'
+    """
+    weights: Dict[str, float] = {}
+    for coding in accept_encoding.lower().split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for coding in encodings:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(content: bytes, coding: str) -> bytes:
+    """Compress a body which is cached, so it's worth compressing harder."""
+    level = CACHED_LEVELS[coding]
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level).compress(content)
+    if coding == "br":
+        return brotli.compress(content, quality=level)
+    return gzip.compress(content, level, mtime=0)
+
+
+class _GzipCompressor:
+    def __init__(self, level: int) -> None:
+        # wbits=31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdCompressor:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def sync(self) -> bytes:
+        return self._compressor.flush()
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compressor(coding: str) -> Any:
+    """Create an incremental compressor, with `compress(data)` and a final `flush()`.
+
+    `sync()` outputs everything compressed so far, so streamed chunks can be decompressed as they arrive.
+    """
+    level = PER_REQUEST_LEVELS[coding]
+    if coding == "zstd":
+        return _ZstdCompressor(level)
+    if coding == "br":
+        return _BrotliCompressor(level)
+    return _GzipCompressor(level)
+
+
+class CompressionMiddleware:
+    """Compress responses with the content coding preferred by the client, like Starlette's `GZipMiddleware`.
+
+    Responses smaller than `minimum_size`, responses which already have a `Content-Encoding`,
+    and Server-Sent Event streams (which must be delivered event by event) are sent as is.
+    Each chunk of a streamed response is flushed, so e.g. NDJSON lines reach the client as they're rendered.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            coding = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+            if coding is not None:
+                responder = _CompressionResponder(self.app, coding, self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, coding: str, minimum_size: int) -> None:
+        self.app = app
+        self.coding = coding
+        self.minimum_size = minimum_size
+        self.send: Send = _unattached_send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Any = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Hold back the headers until the first body message shows if the response is worth compressing.
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or headers.get(
+                "content-type", ""
+            ).startswith("text/event-stream")
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            if self.passthrough or (len(body) < self.minimum_size and not more_body):
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers["Content-Encoding"] = self.coding
+            headers.add_vary_header("Accept-Encoding")
+            self.compressor = compressor(self.coding)
+            message["body"] = self.compressor.compress(body)
+            if more_body:
+                del headers["Content-Length"]
+                message["body"] += self.compressor.sync()
+            else:
+                message["body"] += self.compressor.flush()
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+        elif self.passthrough:
+            await self.send(message)
+        else:
+            message["body"] = self.compressor.compress(body)
+            if more_body:
+                message["body"] += self.compressor.sync()
+            else:
+                message["body"] += self.compressor.flush()
+            await self.send(message)
+
+
+async def _unattached_send(message: Message) -> None:
+    raise RuntimeError("send awaitable not set")  # pragma: no cover
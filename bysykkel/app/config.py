@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Dict, Literal, Optional
 
 from pydantic import BaseSettings, AnyUrl
 
@@ -19,6 +19,46 @@ class Settings(BaseSettings):
     port: int = 8000
     env: Literal["dev", "staging", "prod"] = "dev"
     oslobysykkel_apiurl: AnyUrl = "https://gbfs.urbansharing.com/oslobysykkel.no"  # type: ignore
+    # Other GBFS systems to serve on `/v1/{system}/...` routes, by name, as JSON. Oslo Bysykkel is served as `default_system`.
+    # E.g. `{"bergenbysykkel": "https://gbfs.urbansharing.com/bergenbysykkel.no"}`
+    systems: Dict[str, AnyUrl] = {}
+    default_system: str = "oslobysykkel"
+    # Resolve the feed URLs of every system from its `gbfs.json`
+    gbfs_discovery: bool = False
+    # Upstream HTTP connection pool. HTTP/2 requires installing `bysykkel[http2]`.
+    http_timeout: float = 5.0
+    http_max_connections: int = 10
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0
+    http2: bool = False
+    # Retries of failed upstream queries, with jittered exponential backoff from `http_retry_backoff` seconds
+    http_retries: int = 2
+    http_retry_backoff: float = 0.2
+    # Stop querying upstream for `breaker_reset_timeout` seconds after `breaker_failure_threshold` consecutive failures
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+    # Station snapshot caching, in seconds. The default TTL is used if the feeds don't provide one.
+    cache_default_ttl: int = 10
+    cache_max_stale: int = 300
+    # Max seconds a request waits for upstream, before serving the last good snapshot (or failing if there is none)
+    cache_refresh_timeout: float = 10.0
+    # Poll upstream in the background instead of fetching on the request path.
+    poller_enabled: bool = False
+    poller_info_interval: int = 300
+    # Max number of undelivered events per `/v1/stations/events` subscriber, before it's dropped.
+    events_queue_size: int = 16
+    # Number of worker processes. With more than one, a separate process polls upstream and shares the snapshots.
+    workers: int = 1
+    # Read the snapshots shared by the poller process from this directory. Set by `bysykkel.app.serve` for the workers.
+    shared_snapshot_dir: Optional[str] = None
+    # Compress responses of at least this many bytes, if they're not already compressed
+    compression_min_size: int = 500
+    # Serve Prometheus metrics on `/metrics`. Requires installing `bysykkel[metrics]`.
+    metrics_enabled: bool = False
+    # Record the station status history in an SQLite database at this path, if set.
+    history_path: Optional[str] = None
+    # Timezone of the hours of the week in the station availability rollups
+    history_timezone: str = "Europe/Oslo"
 
     class Config:
         env_prefix = "BYSYKKEL_"
@@ -0,0 +1,173 @@
+"""Server-Sent Events feed of changes to the stations.
+
+A single `DeltaBroadcaster` task watches for new snapshots, computes the changes since the previous snapshot once,
+encodes them once, and fans the encoded event out to every subscriber.
+Subscribers have bounded queues, and subscribers which fall too far behind are dropped.
+
+References:
+    Server-Sent Events: https://html.spec.whatwg.org/multipage/server-sent-events.html
+"""
+
+import asyncio
+from logging import getLogger
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from bysykkel.app.rendering import RenderCache, encode_json
+from bysykkel.cache import StationSnapshot
+from bysykkel.client import diff_stations
+
+# Status fields which are compared between snapshots
+STATUS_FIELDS = (
+    "is_installed",
+    "is_renting",
+    "is_returning",
+    "num_bikes_available",
+    "num_docks_available",
+)
+
+
+def station_deltas(
+    previous: StationSnapshot, current: StationSnapshot
+) -> Dict[str, Any]:
+    """Get the changes from the `previous` to the `current` snapshot.
+
+    Changed stations only include their `station_id`, `last_reported` and the status fields which changed.
+    Added stations include all their fields, and removed stations are listed by id.
+    """
+    diff = diff_stations(previous.stations, current.stations, STATUS_FIELDS)
+    changed: List[Dict[str, Any]] = [
+        {
+            "station_id": station_id,
+            "last_reported": current.stations[station_id].last_reported,
+            **delta,
+        }
+        for station_id, delta in diff.changed.items()
+    ]
+    return {
+        "last_updated": current.last_updated,
+        "changed": changed,
+        "added": [station.__dict__ for station in diff.added],
+        "removed": diff.removed,
+    }
+
+
+def sse_event(event: str, data: bytes) -> bytes:
+    """Encode a Server-Sent Event with single-line data."""
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class DeltaBroadcaster:
+    """Fans out station changes to Server-Sent Event subscribers.
+
+    New subscribers first get a `snapshot` event with all the stations,
+    followed by a `delta` event for each new snapshot.
+    Snapshots are only watched while there are subscribers, so e.g. a `SnapshotCache` isn't kept refreshing for nobody.
+    """
+
+    def __init__(
+        self,
+        get_snapshot: Callable[[], Awaitable[StationSnapshot]],
+        render_cache: RenderCache,
+        queue_size: int = 16,
+        retry_interval: int = 5,
+    ) -> None:
+        """
+        Args:
+            get_snapshot: Gets the current snapshot, e.g. `SnapshotCache.get` or `StationPoller.get`.
+            render_cache: Cache of encoded station lists, for the initial `snapshot` events.
+            queue_size: Maximum number of undelivered events per subscriber, before it's dropped.
+            retry_interval: Seconds to wait before trying again if getting a snapshot fails.
+        """
+        self.get_snapshot = get_snapshot
+        self.render_cache = render_cache
+        self.queue_size = queue_size
+        self.retry_interval = retry_interval
+        self.logger = getLogger(type(self).__name__)
+        self._snapshot: Optional[StationSnapshot] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        # Set while there are subscribers
+        self._active = asyncio.Event()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, snapshot: StationSnapshot) -> None:
+        """Send the changes since the previously published snapshot to all subscribers."""
+        previous, self._snapshot = self._snapshot, snapshot
+        if previous is None or previous.stations is snapshot.stations:
+            return
+
+        event = sse_event("delta", encode_json(station_deltas(previous, snapshot)))
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.logger.warning("Dropping slow subscriber")
+                self._drop(queue)
+
+    async def subscribe(self, snapshot: StationSnapshot) -> AsyncIterator[bytes]:
+        """Yield encoded Server-Sent Events for a new subscriber, until it's dropped.
+
+        The first event has all the stations of the latest published snapshot, or of `snapshot` if none is published yet.
+        """
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        if not self._subscribers:
+            # The published snapshot is outdated if nobody was subscribed
+            self._snapshot = snapshot
+        self._subscribers.add(queue)
+        self._active.set()
+        self.start()
+        try:
+            stations = (self._snapshot or snapshot).stations
+            yield sse_event("snapshot", self.render_cache.get(stations).content)
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._unsubscribe(queue)
+
+    def _unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._active.clear()
+
+    def _drop(self, queue: asyncio.Queue) -> None:
+        # Make room for the sentinel which ends the subscription.
+        self._unsubscribe(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for queue in list(self._subscribers):
+            self._drop(queue)
+
+    async def _run(self) -> None:
+        while True:
+            # Wait for a subscriber, instead of getting snapshots nobody receives
+            await self._active.wait()
+            try:
+                snapshot = await self.get_snapshot()
+            except Exception as e:
+                self.logger.warning(f"Failed to get station snapshot: {e!r}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            self.publish(snapshot)
+            # Check again when the snapshot expires, in case a new one is available
+            await asyncio.sleep(max(snapshot.ttl - snapshot.age, 1))
@@ -1,17 +1,48 @@
+import asyncio
 import logging
-
-from typing import List, Optional
-
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+import math
+import os
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import islice
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from fastapi import status
 import httpx
 from dotenv import load_dotenv
 
-from bysykkel.client import BysykkelClient
-from bysykkel.models import StationData, PartialStationData
+from bysykkel import metrics
+from bysykkel.cache import SnapshotCache, SnapshotUnavailableError, StationSnapshot
+from bysykkel.client import BysykkelClient, CircuitBreaker, UpstreamError
+from bysykkel.filters import StationFilter, compile_filter
+from bysykkel.history import HistoryRecorder, HistoryStore
+from bysykkel.models import (
+    NearbyStationData,
+    StationCollection,
+    StationData,
+    StationRollup,
+    StationStatusSample,
+    PartialStationData,
+)
+from bysykkel.poller import StationPoller
+from bysykkel.shared import SharedSnapshotReader
 from bysykkel.app.config import Settings
-
+from bysykkel.app.events import DeltaBroadcaster
+from bysykkel.app.compression import CompressionMiddleware
+from bysykkel.app.rendering import (
+    FIELD_NAMES,
+    MEDIA_TYPES,
+    RENDERERS,
+    RenderCache,
+    msgpack,
+    render_ndjson,
+)
 
 load_dotenv()
 
@@ -20,153 +51,651 @@ logger = logging.getLogger(__name__)
 settings = Settings()  # type: ignore
 
 app = FastAPI(title=settings.app_name)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size)
+# Station routes, which are served for every system. See `station_system()`.
+router = APIRouter()
+
+
+# A single connection pool is shared by the clients of all systems, so upstream connections are reused across requests.
+# Its connections are closed on shutdown.
+session = httpx.AsyncClient(
+    headers={"Client-Identifier": f"eirikeve-bysykkel-{settings.env}"},
+    timeout=httpx.Timeout(settings.http_timeout),
+    limits=httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    ),
+    http2=settings.http2,
+)
 
 
-def client():
-    client_identifier = f"eirikeve-bysykkel-{settings.env}"
+def client(base_url: str = settings.oslobysykkel_apiurl) -> BysykkelClient:
     return BysykkelClient(
-        settings.oslobysykkel_apiurl, client_identifier=client_identifier
+        base_url,
+        session=session,
+        discovery=settings.gbfs_discovery,
+        retries=settings.http_retries,
+        retry_backoff=settings.http_retry_backoff,
+        breaker=CircuitBreaker(
+            settings.breaker_failure_threshold, settings.breaker_reset_timeout
+        ),
     )
 
 
-def _filter_predicate(field: str, comparison: str):
-    if comparison.startswith("<="):
-        value = int(comparison[2:])
-        return lambda x: getattr(x, field) <= value
-    if comparison.startswith("<"):
-        value = int(comparison[1:])
-        return lambda x: getattr(x, field) < value
-    elif comparison.startswith(">="):
-        value = int(comparison[2:])
-        return lambda x: getattr(x, field) >= value
-    elif comparison.startswith(">"):
-        value = int(comparison[1:])
-        return lambda x: getattr(x, field) > value
+# Either a background poller keeping the snapshot up to date,
+# or a cache only querying upstream when the cached snapshot expires.
+# Worker processes started by `bysykkel.app.serve` instead read the snapshots published by a single poller process.
+StationSource = Union[StationPoller, SnapshotCache, SharedSnapshotReader]
 
-    value = int(comparison)
-    return lambda x: getattr(x, field) == value
 
+def source(bysykkel_client: BysykkelClient, name: str) -> StationSource:
+    if settings.shared_snapshot_dir:
+        return SharedSnapshotReader(
+            bysykkel_client,
+            os.path.join(settings.shared_snapshot_dir, f"{name}.json"),
+            default_ttl=settings.cache_default_ttl,
+        )
+    if settings.poller_enabled:
+        return StationPoller(
+            bysykkel_client,
+            default_ttl=settings.cache_default_ttl,
+            info_interval=settings.poller_info_interval,
+        )
+    return SnapshotCache(
+        bysykkel_client,
+        default_ttl=settings.cache_default_ttl,
+        max_stale=settings.cache_max_stale,
+        timeout=settings.cache_refresh_timeout,
+    )
 
-def filter_predicate(field: str, comparison: str):
-    """Create a function that performs a numeric comparison on an object field.
 
-    Example:
-        >>> filter_predicate("foo", ">=10") # predicate to check if `.foo` is >= 10
+@dataclass
+class StationSystem:
+    """A GBFS system served by the app, with its own snapshots and caches.
+
+    `render_cache` holds the encoded `/v1/stations` bodies for the current snapshot,
+    and `delta_broadcaster` pushes station changes to `/v1/stations/events` subscribers.
+    """
+
+    name: str
+    client: BysykkelClient
+    source: StationSource
+    render_cache: RenderCache
+    delta_broadcaster: DeltaBroadcaster
+
+    @classmethod
+    def from_url(cls, name: str, base_url: str) -> "StationSystem":
+        bysykkel_client = client(base_url)
+        station_source = source(bysykkel_client, name)
+        render_cache = RenderCache()
+        return cls(
+            name,
+            bysykkel_client,
+            station_source,
+            render_cache,
+            DeltaBroadcaster(
+                station_source.get, render_cache, queue_size=settings.events_queue_size
+            ),
+        )
+
+
+# Shared by all requests, by system name. Oslo Bysykkel is served on the routes without a system name.
+systems: Dict[str, StationSystem] = {
+    name: StationSystem.from_url(name, base_url)
+    for name, base_url in {
+        settings.default_system: settings.oslobysykkel_apiurl,
+        **settings.systems,
+    }.items()
+}
+default_system = systems[settings.default_system]
+station_source = default_system.source
+
+
+def snapshot_age(source: StationSource) -> float:
+    return source.snapshot.age if source.snapshot is not None else math.nan
+
 
+if settings.metrics_enabled:
+    metrics.enable()
+    for name, system in systems.items():
+        metrics.SNAPSHOT_AGE_SECONDS.labels(name).set_function(
+            partial(snapshot_age, system.source)
+        )
+
+
+def station_system(system: str = settings.default_system) -> StationSystem:
+    """Get a system by name, or raise a 404 `HTTPException` if there's no such system."""
+    if system not in systems:
+        raise HTTPException(404, detail=f"System not found: {system}")
+    return systems[system]
+
+
+# Records the station status history, if enabled.
+# When sharing snapshots between workers, the history is only recorded by the poller process.
+history_store = (
+    HistoryStore(settings.history_path, tz=ZoneInfo(settings.history_timezone))
+    if settings.history_path
+    else None
+)
+history_recorder = (
+    HistoryRecorder(history_store, station_source.get)
+    if history_store is not None and not settings.shared_snapshot_dir
+    else None
+)
+
+NDJSON = "application/x-ndjson"
+MSGPACK = ("application/msgpack", "application/x-msgpack")
+
+
+@app.on_event("startup")
+async def startup():
+    # The systems are polled concurrently
+    for system in systems.values():
+        if isinstance(system.source, StationPoller):
+            system.source.start()
+    if history_recorder is not None:
+        history_recorder.start()
 
+
+@app.on_event("shutdown")
+async def shutdown():
+    if history_recorder is not None:
+        await history_recorder.stop()
+    for system in systems.values():
+        await system.delta_broadcaster.stop()
+        if isinstance(system.source, StationPoller):
+            await system.source.stop()
+    if history_store is not None:
+        history_store.close()
+    await session.aclose()
+
+
+async def get_snapshot(source: StationSource) -> StationSnapshot:
+    """Get the current station snapshot, or raise a 503/504 `HTTPException` if there is none."""
+    try:
+        return await source.get()
+    except UpstreamError as e:
+        logger.warning(f"Caught exception due to upstream error: {e}")
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Failed to query Oslo Bysykkel's API",
+        )
+    except asyncio.TimeoutError as e:
+        logger.warning(f"Caught exception due to upstream timeout: {e!r}")
+        raise HTTPException(
+            status.HTTP_504_GATEWAY_TIMEOUT,
+            "Timed out querying Oslo Bysykkel's API",
+        )
+    except SnapshotUnavailableError as e:
+        logger.warning(f"Caught exception due to missing snapshot: {e}")
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Station data from Oslo Bysykkel's API is not loaded yet",
+        )
+
+
+def age_header(snapshot: StationSnapshot) -> Dict[str, str]:
+    """`Age` header with the seconds since the snapshot was fetched, so clients can tell when a stale snapshot is served."""
+    return {"Age": str(int(snapshot.age))}
+
+
+def observe_stage(route: str, stage: str, start: float) -> float:
+    """Record the time since `start` spent in a stage of handling a request, if metrics are enabled.
+
+    Returns the current time, as the start of the next stage.
     """
+    now = perf_counter()
+    if metrics.enabled:
+        metrics.REQUEST_STAGE_SECONDS.labels(route, stage).observe(now - start)
+    return now
+
+
+def observe_stream(route: str, stage: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Pass on the chunks of a streamed response, and record the time spent producing them once they're all sent.
+
+    Only the time spent in the `chunks` iterator is recorded, not the time spent sending the chunks to the client.
+    """
+    if not metrics.enabled:
+        yield from chunks
+        return
+    iterator = iter(chunks)
+    elapsed, size = 0.0, 0
+    while True:
+        start = perf_counter()
+        chunk = next(iterator, None)
+        elapsed += perf_counter() - start
+        if chunk is None:
+            break
+        size += len(chunk)
+        yield chunk
+    metrics.REQUEST_STAGE_SECONDS.labels(route, stage).observe(elapsed)
+    metrics.RESPONSE_BYTES.labels(route).observe(size)
+
+
+def station_filter(**expressions: Optional[str]) -> StationFilter:
+    """Compile filter expressions on station fields, or raise a 400 `HTTPException` if they're unsupported.
+
+    Example:
+        >>> station_filter(num_bikes_available=">=10", is_renting="true")
+    """
+    query = tuple(
+        (field, expression) for field, expression in expressions.items() if expression
+    )
     try:
-        return _filter_predicate(field, comparison)
+        return compile_filter(query)
     except ValueError as e:
         logging.warning(f"Caught exception due to unsupported filter: {e}")
+        unsupported = "&".join(f"{field}={expression}" for field, expression in query)
         raise HTTPException(
-            status.HTTP_400_BAD_REQUEST, f"Unsupported filter {field}{comparison}"
+            status.HTTP_400_BAD_REQUEST, f"Unsupported filter {unsupported}"
         )
 
 
-@app.get(
-    "/v1/stations",
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """Parse a `min_lon,min_lat,max_lon,max_lat` bounding box, or raise a 400 `HTTPException` if it's invalid."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(","))
+    except ValueError as e:
+        logging.warning(f"Caught exception due to invalid bounding box: {e}")
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, f"Unsupported bounding box {bbox}"
+        )
+    if not all(map(math.isfinite, (min_lon, min_lat, max_lon, max_lat))) or (
+        min_lon > max_lon or min_lat > max_lat
+    ):
+        logging.warning(f"Caught invalid bounding box: {bbox}")
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, f"Unsupported bounding box {bbox}"
+        )
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def parse_sort(sort: str) -> Tuple[str, bool]:
+    """Parse a sort order into a field and whether it's descending, or raise a 400 `HTTPException` if it's unsupported.
+
+    Example:
+        >>> parse_sort("-num_bikes_available")
+        ('num_bikes_available', True)
+    """
+    field = sort.removeprefix("-")
+    if field not in FIELD_NAMES:
+        logging.warning(f"Caught unsupported sort order: {sort}")
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unsupported sort {sort}")
+    return field, sort.startswith("-")
+
+
+def as_utc(value: datetime) -> datetime:
+    """Interpret datetimes without a timezone as UTC."""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+@router.get(
+    "/stations",
     response_model=List[PartialStationData],
     response_model_exclude_defaults=True,
     # TODO: Update responses here so the OpenAPI doc includes all status codes.
 )
 async def get_stations(
+    request: Request,
+    ids: Optional[str] = None,
     fields: Optional[str] = None,
-    limit: Optional[int] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=0),
+    offset: int = Query(0, ge=0),
     num_bikes_available: Optional[str] = None,
     num_docks_available: Optional[str] = None,
-    client: BysykkelClient = Depends(client),
+    capacity: Optional[str] = None,
+    is_installed: Optional[str] = None,
+    is_renting: Optional[str] = None,
+    is_returning: Optional[str] = None,
+    lat: Optional[str] = None,
+    lon: Optional[str] = None,
+    last_reported: Optional[str] = None,
+    bbox: Optional[str] = None,
+    format: Optional[Literal["json", "ndjson", "columnar", "msgpack"]] = None,
+    system: StationSystem = Depends(station_system),
 ):
     """Get a list of city bike stations, optionally filtering the list and picking a subset of the station fields.
 
     Parameters
     ==========
+    - `system`: Route parameter to pick another configured GBFS system than Oslo Bysykkel, on the `/v1/{system}/...` routes. Example: `bergenbysykkel`
+    - `ids`: An optional comma-separated list of station ids to look up, in one request against one snapshot of the stations.
+        The stations are returned in the same order, and unknown ids are left out. Example: `627,623`
     - `fields`: An optional comma-separated list of fields to return for each city bike station object. Example: `station_id,num_bikes_available`
-    - `limit`: An optional integer indicating the maximum number of city bike stations to return. Example: `10`
+    - `sort`: An optional field to order the city bike stations by, prefixed with `-` for descending order.
+        By default, and among stations with equal values, stations are ordered by `station_id` (or as in `ids`). Example: `-num_bikes_available`
+    - `limit`: An optional integer indicating the maximum number of city bike stations to return. `0` means no limit. Example: `10`
+    - `offset`: An optional number of city bike stations to skip, e.g. to get the next page of a `limit`ed list. Example: `10`
     - `num_bikes_available`: An optional integer or comparison (<=, <, >=, >) followed by an integer to filter the city bike stations
         by how many bikes they currently have available. Example: `>=5` or `<10`
     - `num_docks_available`: An optional integer or comparison (<=, <, >=, >) followed by an integer to filter the city bike stations
         by how many free docks they currently have available. Example: `>=5` or `0`
+    - `capacity`, `is_installed`, `is_renting`, `is_returning`, `lat`, `lon`, `last_reported`: Optional filters on the other numeric fields.
+        `last_reported` is compared as a POSIX timestamp. Example: `is_renting=true` or `capacity=>=20`
+
+    All the filters also support `!=` (not equal), ranges (`5..10`, `5..` or `..10`) and lists of accepted values (`1,2,3`).
+
+    - `bbox`: An optional bounding box `min_lon,min_lat,max_lon,max_lat` to filter the city bike stations by location.
+        Example: `10.70,59.90,10.80,59.95`
+    - `format`: An optional response format, `json` (default), `ndjson`, `columnar` or `msgpack`.
+        NDJSON (one station object per line) is streamed, and can also be requested with an `Accept: application/x-ndjson` header.
+        Columnar JSON is an object with a list of values per field, e.g. `{"station_id": ["627", "623"], "num_bikes_available": [7, 4]}`.
+        MessagePack can also be requested with an `Accept: application/msgpack` header.
+
+    Responses are compressed with `zstd`, `br` or `gzip`, as accepted by the `Accept-Encoding` header.
 
     Response codes
     ==============
     - `200`: Successful response
-    - `400`: Unsupported filter query
-    - `503`: Connection to Oslo Bysykkel's API failed
+    - `304`: Not modified, for requests without `ids`, filters, `limit` or `offset` with an `If-None-Match` header matching the `ETag`
+    - `400`: Unsupported filter query, sort order or bounding box
+    - `404`: System not found
+    - `406`: MessagePack is not supported by the server
+    - `503`: Querying Oslo Bysykkel's API failed, or station data is not loaded yet
+    - `504`: Querying Oslo Bysykkel's API timed out
     """
 
-    filters = []
-    if num_bikes_available:
-        filters.append(filter_predicate("num_bikes_available", num_bikes_available))
-    if num_docks_available:
-        filters.append(filter_predicate("num_docks_available", num_docks_available))
-
-    # This fetches both the metadata, and the current status/availability for all stations.
-    try:
-        stations: List[StationData] = await client.get_stations()
-    except httpx.NetworkError as e:
-        logger.warning(f"Caught exception due to connection error: {e}")
+    accept = request.headers.get("Accept", "")
+    if format is None and any(media_type in accept for media_type in MSGPACK):
+        format = "msgpack"
+    if format == "msgpack" and msgpack is None:
         raise HTTPException(
-            status.HTTP_503_SERVICE_UNAVAILABLE,
-            "Failed to connect to Oslo Bysykkel's API",
+            status.HTTP_406_NOT_ACCEPTABLE, "MessagePack responses are not supported"
         )
 
-    if filters:
-        stations = [
-            station
-            for station in stations
-            if all(filter(station) for filter in filters)
-        ]
+    query_filter = station_filter(
+        num_bikes_available=num_bikes_available,
+        num_docks_available=num_docks_available,
+        capacity=capacity,
+        is_installed=is_installed,
+        is_renting=is_renting,
+        is_returning=is_returning,
+        lat=lat,
+        lon=lon,
+        last_reported=last_reported,
+    )
+
+    bounding_box = parse_bbox(bbox) if bbox else None
+    order = parse_sort(sort) if sort else None
+
+    # Contains both the metadata, and the current status/availability for all stations.
+    start = perf_counter()
+    snapshot = await get_snapshot(system.source)
+    start = observe_stage("stations", "snapshot", start)
+    columns = snapshot.columns
+
+    field_names = frozenset(fields.split(",")) if fields else None
+
+    ndjson = format == "ndjson" or (format is None and NDJSON in accept)
+    body_format = format if format in RENDERERS else "json"
 
-    if fields:
-        field_names = set(fields.split(","))
-        filtered_station_data = [
-            {k: v for k, v in station.dict().items() if k in field_names}
-            for station in stations
-        ]
-        stations = [PartialStationData(**data) for data in filtered_station_data]
+    if not (ids or query_filter or bounding_box or limit or offset or ndjson):
+        # The response only depends on the snapshot, fields and order, so it's rendered once per snapshot.
+        rendered = system.render_cache.get(
+            snapshot.stations,
+            field_names,
+            body_format,
+            sort,
+            columns.ordering(*order) if order else None,
+        )
+        observe_stage("stations", "render_cache", start)
+        if metrics.enabled:
+            metrics.RESPONSE_BYTES.labels("stations").observe(len(rendered.content))
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        headers = {
+            "ETag": rendered.variant_etag(accept_encoding),
+            "Vary": "Accept, Accept-Encoding",
+            **age_header(snapshot),
+        }
+        if rendered.matches(request.headers.get("If-None-Match")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        content, encoding = rendered.encode(accept_encoding)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content, media_type=MEDIA_TYPES[body_format], headers=headers)
+
+    # Stations are filtered, sorted, projected and limited lazily, so e.g. a small `limit` stops early.
+    rows: Optional[Iterable[int]] = None
+    if ids:
+        rows = columns.rows(ids.split(","))
+    if bounding_box:
+        within = {
+            columns.index[station_id]
+            for station_id in snapshot.spatial.within(*bounding_box)
+            if station_id in columns
+        }
+        rows = sorted(within) if rows is None else [r for r in rows if r in within]
+    presorted = order is not None and rows is None
+    if presorted:
+        # Walk all the stations in the snapshot's precomputed order, so the first matches are the top ones.
+        rows = columns.ordering(*order)  # type: ignore
+    if query_filter:
+        # Only the stations looked up by id or location are filtered, instead of whole columns.
+        rows = (
+            query_filter.iter_rows(columns)
+            if rows is None
+            else query_filter.filter_rows(columns, rows)
+        )
+    if order is not None and not presorted:
+        # Only the stations looked up by id or location are sorted, or just the top ones if there's a `limit`.
+        top = offset + limit if limit else None
+        rows = columns.sort_rows(rows, *order, limit=top)  # type: ignore
+
+    stations: Iterable[StationData] = snapshot.stations
+    if rows is not None:
+        stations = snapshot.stations.rows(rows)
+    if limit or offset:
+        stations = islice(stations, offset, offset + limit if limit else None)
+
+    # The stations are only filtered and projected as they're rendered, so that's timed as one stage.
+    if ndjson:
+        return StreamingResponse(
+            observe_stream(
+                "stations", "filter_render", render_ndjson(stations, field_names)
+            ),
+            media_type=NDJSON,
+            headers=age_header(snapshot),
+        )
+    content = RENDERERS[body_format](stations, field_names)
+    observe_stage("stations", "filter_render", start)
+    if metrics.enabled:
+        metrics.RESPONSE_BYTES.labels("stations").observe(len(content))
+    return Response(
+        content,
+        media_type=MEDIA_TYPES[body_format],
+        headers={"Vary": "Accept", **age_header(snapshot)},
+    )
 
-    if limit:
-        return stations[:limit]
-    return stations
 
+@router.get(
+    "/stations/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def get_station_events(system: StationSystem = Depends(station_system)):
+    """Subscribe to changes to the city bike stations, as a stream of Server-Sent Events.
+
+    Events
+    ======
+    - `snapshot`: Sent first, with a list of all the city bike stations, like from the `/v1/stations` route.
+    - `delta`: Sent when the stations change, with `changed` stations (only their `station_id`, `last_reported` and changed status fields),
+        `added` stations and the ids of `removed` stations.
+
+    Subscribers which don't keep up with the events are disconnected, and should reconnect to get a new `snapshot`.
+
+    Response codes
+    ==============
+    - `200`: Successful response
+    - `503`: Querying Oslo Bysykkel's API failed, or station data is not loaded yet
+    - `504`: Querying Oslo Bysykkel's API timed out
+    """
+
+    snapshot = await get_snapshot(system.source)
+    return StreamingResponse(
+        system.delta_broadcaster.subscribe(snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
-@app.get("/v1/station/{id}", response_model=StationData)
+
+@router.get("/stations/nearest", response_model=List[NearbyStationData])
+async def get_nearest_stations(
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=100),
+    min_bikes: int = 0,
+    min_docks: int = 0,
+    system: StationSystem = Depends(station_system),
+):
+    """Get the city bike stations nearest to a location, ordered by distance.
+
+    Parameters
+    ==========
+    - `system`: Route parameter to pick another configured GBFS system than Oslo Bysykkel, on the `/v1/{system}/...` routes. Example: `bergenbysykkel`
+    - `lat`, `lon`: The location to search from. Example: `lat=59.91&lon=10.75`
+    - `k`: The maximum number of city bike stations to return, at most 100. Example: `5`
+    - `min_bikes`: Only return stations with at least this many bikes available. Example: `1`
+    - `min_docks`: Only return stations with at least this many free docks available. Example: `1`
+
+    Each station includes its `distance` in meters from the location.
+
+    Response codes
+    ==============
+    - `200`: Successful response
+    - `503`: Querying Oslo Bysykkel's API failed, or station data is not loaded yet
+    - `504`: Querying Oslo Bysykkel's API timed out
+    """
+
+    snapshot = await get_snapshot(system.source)
+    response.headers.update(age_header(snapshot))
+    columns = snapshot.columns
+    bikes, docks = columns["num_bikes_available"], columns["num_docks_available"]
+
+    # The availability is checked during the search, so it continues until k available stations are found.
+    def available(station_id: str) -> bool:
+        row = columns.index.get(station_id)
+        return row is not None and bikes[row] >= min_bikes and docks[row] >= min_docks
+
+    return [
+        NearbyStationData.construct(
+            **snapshot.stations[station_id].__dict__, distance=distance
+        )
+        for station_id, distance in snapshot.spatial.nearest(lat, lon, k, available)
+    ]
+
+
+@router.get("/station/{id}", response_model=StationData)
 async def get_station(
+    response: Response,
     id: str,
-    client: BysykkelClient = Depends(client),
+    system: StationSystem = Depends(station_system),
 ):
     """Get a single city bike station's data by id.
 
     Parameters
     ==========
     - `id`: Route parameter to pick the station. Corresponds to `station_id` in the objects from the `/v1/stations` route.
+    - `system`: Route parameter to pick another configured GBFS system than Oslo Bysykkel, on the `/v1/{system}/...` routes. Example: `bergenbysykkel`
 
     Response codes
     ==============
     - `200`: Successful response
-    - `404`: Station `id` not found
-    - `503`: Connection to Oslo Bysykkel's API failed
+    - `404`: Station `id` or system not found
+    - `503`: Querying Oslo Bysykkel's API failed, or station data is not loaded yet
+    - `504`: Querying Oslo Bysykkel's API timed out
     """
 
-    # TODO: This is pretty reduntant: we're fetching data for all the stations.
-    #       Might want to optimize it to avoid unnecessary load on Oslo Bysykkel's API,
-    #       e.g. by leveraging some form of caching
-    try:
-        stations: List[StationData] = await client.get_stations()
-    except httpx.NetworkError as e:
-        logger.warning(f"Caught exception due to connection error: {e}")
+    snapshot = await get_snapshot(system.source)
+    response.headers.update(age_header(snapshot))
+    stations: StationCollection = snapshot.stations
+
+    if id not in stations:
+        raise HTTPException(404, detail=f"Station not found: {id}")
+    return stations[id]
+
+
+# The station routes are served both for Oslo Bysykkel and for every other system, e.g. `/v1/bergenbysykkel/stations`.
+app.include_router(router, prefix="/v1")
+app.include_router(router, prefix="/v1/{system}")
+
+
+@app.get("/v1/station/{id}/history", response_model=List[StationStatusSample])
+def get_station_history(
+    id: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    resolution: Optional[int] = Query(None, gt=0),
+):
+    """Get the status history of a single city bike station, ordered by time.
+
+    Parameters
+    ==========
+    - `id`: Route parameter to pick the station. Corresponds to `station_id` in the objects from the `/v1/stations` route.
+    - `from`: Start of the time range, as an ISO 8601 datetime or POSIX timestamp. Defaults to 24 hours before `to`.
+    - `to`: End of the time range, as an ISO 8601 datetime or POSIX timestamp. Defaults to now.
+    - `resolution`: An optional number of seconds to downsample the history to. Example: `3600` for (at most) hourly samples
+
+    The first sample is the station's status at `from`. Samples are only recorded when the station's status changes.
+
+    Response codes
+    ==============
+    - `200`: Successful response
+    - `400`: `from` is after `to`
+    - `404`: Station history is not enabled
+    """
+
+    if history_store is None:
+        raise HTTPException(404, detail="Station history is not enabled")
+
+    # Runs in the threadpool, as the history is read from disk.
+    end = as_utc(end) if end else datetime.now(timezone.utc)
+    start = as_utc(start) if start else end - timedelta(days=1)
+    if start > end:
         raise HTTPException(
-            status.HTTP_503_SERVICE_UNAVAILABLE,
-            "Failed to connect to Oslo Bysykkel's API",
+            status.HTTP_400_BAD_REQUEST, f"Unsupported time range {start} to {end}"
         )
+    return history_store.history(id, start, end, resolution)
+
+
+@app.get("/v1/station/{id}/rollups", response_model=List[StationRollup])
+def get_station_rollups(
+    id: str,
+    weekday: Optional[int] = Query(None, ge=0, le=6),
+    hour: Optional[int] = Query(None, ge=0, le=23),
+):
+    """Get the availability of a single city bike station per hour of the week, aggregated over its history.
+
+    Parameters
+    ==========
+    - `id`: Route parameter to pick the station. Corresponds to `station_id` in the objects from the `/v1/stations` route.
+    - `weekday`: An optional weekday to get the rollups for, from Monday (`0`) to Sunday (`6`).
+    - `hour`: An optional hour of the day to get the rollups for, in local time. Example: `8` for 08:00-09:00
 
-    for station in stations:
-        # TODO: We already order the stations by id in the client,
-        # if we expose that dict we could get rid of this loop
-        if station.station_id == id:
-            return station
-    raise HTTPException(404, detail=f"Station not found: {id}")
+    Each rollup has the minutes the station was observed, empty and full during that hour of the week,
+    and the min, mean and max number of bikes available.
+
+    Response codes
+    ==============
+    - `200`: Successful response
+    - `404`: Station history is not enabled
+    """
+
+    if history_store is None:
+        raise HTTPException(404, detail="Station history is not enabled")
+    # Runs in the threadpool, as the rollups are read from disk.
+    return history_store.rollups(id, weekday, hour)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    "Prometheus metrics"
+    if not metrics.enabled:
+        raise HTTPException(404, detail="Metrics are not enabled")
+    content, content_type = metrics.render()
+    return Response(content, media_type=content_type)
 
 
 @app.get("/live")
@@ -178,7 +707,10 @@ def live():
 @app.get("/ready")
 def ready():
     "Readiness probe"
-    # No setup required as the app is stateless.
+    # When polling in the background, or reading shared snapshots,
+    # we're not ready until the first snapshot of every system is loaded.
+    if not all(system.source.is_ready for system in systems.values()):
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Not ready")
     return {"ready": True}
 
 
@@ -190,5 +722,9 @@ async def redirect_root_to_docs():
 if __name__ == "__main__":
     import uvicorn
 
-    # TODO: Uvicorn isn't suited for prod, should be updated to use gunicorn in prod
-    uvicorn.run(app, host=settings.host, port=settings.port)
+    if settings.workers > 1:
+        from bysykkel.app.serve import serve
+
+        serve(settings)
+    else:
+        uvicorn.run(app, host=settings.host, port=settings.port)
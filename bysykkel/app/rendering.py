@@ -0,0 +1,221 @@
+"""Rendering of station lists into response bodies, cached per snapshot.
+
+The station list only changes when a new snapshot is loaded, so the encoded body,
+its compressed variants and its `ETag` are computed once per snapshot, format and `fields` projection.
+
+Besides JSON, station lists can be encoded as columnar JSON, or as MessagePack (which requires installing `bysykkel[msgpack]`).
+
+References:
+    MessagePack: https://msgpack.org/
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from bysykkel import metrics
+from bysykkel.app.compression import compress, negotiate
+from bysykkel.models import PartialStationData, StationCollection, StationData
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+# Same field order as the `PartialStationData` response model
+FIELD_NAMES = tuple(PartialStationData.__fields__)
+
+
+def encode_json(value: Any) -> bytes:
+    """Encode a value as compact JSON, with datetimes in ISO 8601 format."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value,
+        default=lambda v: v.isoformat(),
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _field_names(field_names: Optional[FrozenSet[str]]) -> List[str]:
+    return [name for name in FIELD_NAMES if field_names is None or name in field_names]
+
+
+def _project(station: StationData, names: List[str]) -> Dict[str, Any]:
+    values = station.__dict__
+    return {name: values[name] for name in names if values.get(name) is not None}
+
+
+def render_stations(
+    stations: Iterable[StationData], field_names: Optional[FrozenSet[str]] = None
+) -> bytes:
+    """Encode stations as a JSON list, like the `/v1/stations` response model does.
+
+    Only the fields in `field_names` (or all fields) are included, and fields with `None` values are left out.
+    """
+    names = _field_names(field_names)
+    return encode_json([_project(station, names) for station in stations])
+
+
+def render_ndjson(
+    stations: Iterable[StationData],
+    field_names: Optional[FrozenSet[str]] = None,
+    chunk_size: int = 64,
+) -> Iterator[bytes]:
+    """Lazily encode stations as newline delimited JSON, in chunks of up to `chunk_size` stations.
+
+    Stations are projected like in `render_stations()`, but only consumed from `stations` as the chunks are.
+    """
+    names = _field_names(field_names)
+    chunk = []
+    for station in stations:
+        chunk.append(encode_json(_project(station, names)))
+        if len(chunk) == chunk_size:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+def render_columnar(
+    stations: Iterable[StationData], field_names: Optional[FrozenSet[str]] = None
+) -> bytes:
+    """Encode stations as a JSON object of columns, e.g. `{"station_id": ["627", "623"], "num_bikes_available": [7, 4]}`.
+
+    Every column has a value for every station, in the same order, with `null` for missing values.
+    Field names aren't repeated for every station, so the body is smaller than the list of `render_stations()`.
+    """
+    names = _field_names(field_names)
+    values = [station.__dict__ for station in stations]
+    return encode_json({name: [value.get(name) for value in values] for name in names})
+
+
+def render_msgpack(
+    stations: Iterable[StationData], field_names: Optional[FrozenSet[str]] = None
+) -> bytes:
+    """Encode stations as a MessagePack array of maps, like the JSON list of `render_stations()`."""
+    names = _field_names(field_names)
+    return msgpack.packb(
+        [_project(station, names) for station in stations],
+        default=lambda value: value.isoformat(),
+    )
+
+
+# Renderers and media types of the station list formats
+RENDERERS: Dict[str, Callable[..., bytes]] = {
+    "json": render_stations,
+    "columnar": render_columnar,
+    "msgpack": render_msgpack,
+}
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+@dataclass
+class RenderedBody:
+    """Encoded response body with a strong `ETag`, and lazily compressed variants of it.
+
+    Each content coding is a different representation, so compressed variants have their own `ETag`,
+    with the coding as a suffix, e.g. `"<hash>-br"`.
+    """
+
+    content: bytes
+    etag: str = ""
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if not self.etag:
+            self.etag = f'"{hashlib.blake2b(self.content, digest_size=16).hexdigest()}"'
+
+    def encode(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """Pick the content coding preferred by the client, see `negotiate()`.
+
+        Returns the body, and the `Content-Encoding` (or `None` if uncompressed).
+        Each coding is only compressed once.
+        """
+        coding = negotiate(accept_encoding)
+        if coding is None:
+            return self.content, None
+        if coding not in self.encoded:
+            self.encoded[coding] = compress(self.content, coding)
+        return self.encoded[coding], coding
+
+    def variant_etag(self, accept_encoding: str) -> str:
+        """Get the `ETag` of the variant `encode()` picks for the client."""
+        coding = negotiate(accept_encoding)
+        if coding is None:
+            return self.etag
+        opaque_tag = self.etag.strip('"')
+        return f'"{opaque_tag}-{coding}"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Check if an `If-None-Match` header matches the `ETag` of any variant of this body.
+
+        Any variant matches, since the client has the same content if it has any of them.
+        """
+        if not if_none_match:
+            return False
+        opaque_tags = {
+            etag.strip().removeprefix("W/").strip('"').partition("-")[0]
+            for etag in if_none_match.split(",")
+        }
+        return "*" in opaque_tags or self.etag.strip('"') in opaque_tags
+
+
+class RenderCache:
+    """Cache of rendered bodies of a station collection, by format, `fields` projection and sort order.
+
+    The cache is emptied whenever it's used with a different station collection,
+    i.e. whenever a new snapshot is loaded.
+    """
+
+    def __init__(self) -> None:
+        self._stations: Optional[StationCollection] = None
+        self._bodies: Dict[
+            Tuple[str, Optional[FrozenSet[str]], Optional[str]], RenderedBody
+        ] = {}
+
+    def get(
+        self,
+        stations: StationCollection,
+        field_names: Optional[FrozenSet[str]] = None,
+        format: str = "json",
+        sort: Optional[str] = None,
+        rows: Optional[Sequence[int]] = None,
+    ) -> RenderedBody:
+        """Get the rendered body of the stations, rendering it if it's not cached.
+
+        If the stations are sorted, `sort` names the order, and `rows` are the positions of the stations in that order.
+        """
+        if stations is not self._stations:
+            self._stations = stations
+            self._bodies = {}
+        key = (format, field_names, sort)
+        hit = key in self._bodies
+        if not hit:
+            ordered = stations if rows is None else stations.rows(rows)
+            self._bodies[key] = RenderedBody(RENDERERS[format](ordered, field_names))
+        if metrics.enabled:
+            metrics.RENDER_CACHE_REQUESTS.labels("hit" if hit else "miss").inc()
+        return self._bodies[key]
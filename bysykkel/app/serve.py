@@ -0,0 +1,75 @@
+"""Serving the REST API with multiple worker processes.
+
+A single publisher process polls upstream for every system, and publishes each snapshot to a shared directory
+with a `SnapshotWriter`. The workers read the snapshots with a `SharedSnapshotReader` instead of querying upstream,
+so adding workers scales request throughput without adding upstream queries.
+The publisher also records the station history, if enabled.
+
+Run with e.g. `BYSYKKEL_WORKERS=4 python bysykkel/app/main.py`, or `python -m bysykkel.app.serve`.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import uvicorn
+from dotenv import load_dotenv
+
+from bysykkel.app.config import Settings
+from bysykkel.shared import SnapshotWriter
+
+APP = "bysykkel.app.main:app"
+
+
+def publish(directory: str) -> None:
+    """Poll upstream, and publish the snapshots of every system to `directory` until terminated."""
+    # Poll like a single process would, instead of reading the shared snapshots.
+    # Set rather than unset, so the `.env` doesn't override it.
+    os.environ["BYSYKKEL_SHARED_SNAPSHOT_DIR"] = ""
+    os.environ["BYSYKKEL_POLLER_ENABLED"] = "true"
+    from bysykkel.app import main
+
+    for name, system in main.systems.items():
+        writer = SnapshotWriter(os.path.join(directory, f"{name}.json"))
+        system.source.on_snapshot = writer.write  # type: ignore
+    asyncio.run(_run_publisher(main))
+
+
+async def _run_publisher(main) -> None:
+    await main.startup()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await main.shutdown()
+
+
+def serve(settings: Settings) -> None:
+    """Serve the REST API with `settings.workers` worker processes, and a publisher process."""
+    directory = settings.shared_snapshot_dir
+    created = not directory
+    if created:
+        # Keep the shared snapshots in memory, if there's a tmpfs
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        directory = tempfile.mkdtemp(prefix="bysykkel-", dir=shm)
+    os.environ["BYSYKKEL_SHARED_SNAPSHOT_DIR"] = directory
+
+    publisher = multiprocessing.get_context("spawn").Process(
+        target=publish, args=(directory,), daemon=True
+    )
+    publisher.start()
+    try:
+        uvicorn.run(
+            APP, host=settings.host, port=settings.port, workers=settings.workers
+        )
+    finally:
+        publisher.terminate()
+        publisher.join()
+        if created:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    serve(Settings())  # type: ignore
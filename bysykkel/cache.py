@@ -0,0 +1,203 @@
+import asyncio
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from logging import getLogger
+from time import monotonic
+from typing import Iterable, Optional, Tuple
+
+from bysykkel import metrics
+from bysykkel.client import BysykkelClient, UpstreamError
+from bysykkel.columns import ColumnarStationCollection, StationColumns
+from bysykkel.spatial import GridIndex
+from bysykkel.models import (
+    StationCollection,
+    StationInfoResponse,
+    StationStatusReponse,
+)
+
+
+@dataclass(frozen=True)
+class StationSnapshot:
+    """Merged station info and status, as fetched at a single point in time.
+
+    `last_updated` is the most recent upstream `last_updated` of the two feeds,
+    and `ttl` is the shortest upstream `ttl` (in seconds) of the two feeds.
+    `status` and `info` are the feed responses the snapshot was merged from.
+    `columns` holds the same stations in a column-oriented store, built from `stations` if not given.
+    `stations` is then replaced by a view of the columns, so the merged `StationData` objects aren't kept.
+    `spatial` indexes the station locations, built from `info` (or `stations`) if not given.
+    """
+
+    stations: StationCollection
+    last_updated: datetime
+    ttl: int
+    status: Optional[StationStatusReponse] = None
+    info: Optional[StationInfoResponse] = None
+    fetched_at: float = field(default_factory=monotonic)
+    columns: StationColumns = None  # type: ignore
+    spatial: GridIndex = None  # type: ignore
+
+    def __post_init__(self) -> None:
+        if self.columns is None:
+            object.__setattr__(
+                self, "columns", StationColumns.from_stations(self.stations)
+            )
+        if not isinstance(self.stations, ColumnarStationCollection):
+            object.__setattr__(
+                self, "stations", ColumnarStationCollection(self.columns)
+            )
+        if self.spatial is None:
+            if self.info:
+                locations: Iterable[Tuple[str, float, float]] = (
+                    (station.station_id, station.lat, station.lon)
+                    for station in self.info.data.stations
+                )
+            else:
+                locations = zip(
+                    self.columns["station_id"],  # type: ignore
+                    self.columns["lat"],
+                    self.columns["lon"],
+                )
+            object.__setattr__(self, "spatial", GridIndex(locations))
+
+    @property
+    def age(self) -> float:
+        """Seconds since the snapshot was fetched."""
+        return monotonic() - self.fetched_at
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.age < self.ttl
+
+
+def _count(result: str) -> None:
+    if metrics.enabled:
+        metrics.SNAPSHOT_CACHE_REQUESTS.labels(result).inc()
+
+
+class SnapshotUnavailableError(Exception):
+    """Raised when no station snapshot has been loaded yet."""
+
+
+def build_snapshot(
+    client: BysykkelClient,
+    status: StationStatusReponse,
+    info: StationInfoResponse,
+    default_ttl: int,
+    previous: Optional[StationSnapshot] = None,
+) -> StationSnapshot:
+    """Merge the two station feeds into a snapshot, using `default_ttl` if neither feed has a `ttl`.
+
+    If neither feed changed since the `previous` snapshot, its merged stations are reused,
+    and if the station info didn't change, its spatial index is reused.
+    """
+    if previous is not None and previous.status is status and previous.info is info:
+        return replace(previous, fetched_at=monotonic())
+
+    ttls = [ttl for ttl in (status.ttl, info.ttl) if ttl is not None]
+    return StationSnapshot(
+        stations=client.merge_stations(status, info),
+        last_updated=max(status.last_updated, info.last_updated),
+        ttl=min(ttls) if ttls else default_ttl,
+        status=status,
+        info=info,
+        spatial=previous.spatial if previous and previous.info is info else None,  # type: ignore
+    )
+
+
+class SnapshotCache:
+    """TTL-aware cache of station snapshots in front of a `BysykkelClient`.
+
+    - A snapshot is served as-is while it is younger than the feed's `ttl`.
+    - An expired snapshot is served stale for up to `max_stale` seconds past its `ttl`,
+      while a refresh runs in the background (stale-while-revalidate).
+    - Concurrent cache misses share a single in-flight upstream fetch.
+    - If a snapshot is too stale to serve, but the refresh fails or takes longer than `timeout` seconds,
+      the last good snapshot is served anyway, e.g. while the client's circuit breaker is open.
+
+    References:
+        GBFS output files: https://github.com/MobilityData/gbfs/blob/df473ca4adbff982d67b50ac00b625191591d8f8/gbfs.md#output-format
+    """
+
+    def __init__(
+        self,
+        client: BysykkelClient,
+        default_ttl: int = 10,
+        max_stale: int = 300,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.client = client
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.logger = getLogger(type(self).__name__)
+        self._snapshot: Optional[StationSnapshot] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> Optional[StationSnapshot]:
+        """The most recently fetched snapshot, if any, regardless of its age."""
+        return self._snapshot
+
+    @property
+    def is_ready(self) -> bool:
+        """Always true, as snapshots are fetched on demand."""
+        return True
+
+    async def get(self) -> StationSnapshot:
+        """Get a station snapshot, only waiting on upstream if there's no usable cached snapshot."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            _count("miss")
+            return await self.refresh()
+        if snapshot.is_fresh:
+            _count("hit")
+            return snapshot
+        if snapshot.age < snapshot.ttl + self.max_stale:
+            _count("stale")
+            self.logger.debug(f"Serving stale snapshot ({snapshot.age:.1f}s old)")
+            self._start_refresh()
+            return snapshot
+        _count("miss")
+        try:
+            return await self.refresh()
+        except (UpstreamError, asyncio.TimeoutError) as e:
+            _count("fallback")
+            self.logger.warning(
+                f"Serving last good snapshot ({snapshot.age:.1f}s old) after failed refresh: {e!r}"
+            )
+            return snapshot
+
+    async def refresh(self) -> StationSnapshot:
+        """Fetch a new snapshot, joining the in-flight fetch if there is one.
+
+        Raises `asyncio.TimeoutError` if the fetch takes longer than `timeout` seconds, while it continues in the background.
+        """
+        # Shield the shared fetch, so a cancelled caller doesn't cancel it for the others.
+        return await asyncio.wait_for(
+            asyncio.shield(self._start_refresh()), self.timeout
+        )
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch())
+            self._inflight.add_done_callback(self._refresh_done)
+        return self._inflight
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        self._inflight = None
+        if task.cancelled():
+            return
+        exception = task.exception()
+        if exception is not None:
+            # Callers awaiting the refresh get the exception raised,
+            # but background refreshes have no-one to report to.
+            self.logger.warning(f"Failed to refresh station snapshot: {exception!r}")
+
+    async def _fetch(self) -> StationSnapshot:
+        status, info = await self.client.get_station_feeds()
+        snapshot = build_snapshot(
+            self.client, status, info, self.default_ttl, previous=self._snapshot
+        )
+        self._snapshot = snapshot
+        return snapshot
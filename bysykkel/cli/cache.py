@@ -0,0 +1,99 @@
+"""On-disk cache of station snapshots for the CLI, so repeated invocations within the feed `ttl` skip the network.
+
+Snapshots are stored as plain JSON records, one file per GBFS system, and are read without importing
+the HTTP client or the pydantic models, to keep the startup of cached invocations fast.
+"""
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+Record = Dict[str, Any]
+
+
+def default_cache_dir() -> Path:
+    """`$XDG_CACHE_HOME/bysykkel`, or `~/.cache/bysykkel`."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "bysykkel"
+
+
+def station_record(station: Any) -> Record:
+    """Convert a `StationData` object into a JSON-serializable record."""
+    record = dict(station.__dict__)
+    record["last_reported"] = station.last_reported.isoformat()
+    return record
+
+
+@dataclass
+class CachedSnapshot:
+    stations: List[Record]
+    # POSIX timestamp of when the stations were fetched
+    fetched_at: float
+    ttl: int
+
+    @property
+    def age(self) -> float:
+        """Seconds since the stations were fetched."""
+        return time.time() - self.fetched_at
+
+
+class SnapshotFileCache:
+    """Cache of the latest station snapshot of a GBFS system, in a file in `directory`.
+
+    Example:
+        >>> cache = SnapshotFileCache(default_cache_dir(), "https://gbfs.urbansharing.com/oslobysykkel.no")
+        >>> snapshot = cache.load()
+        >>> if snapshot is None or snapshot.age > snapshot.ttl:
+        ...     snapshot = cache.store(map(station_record, stations), ttl=10)
+    """
+
+    def __init__(self, directory: Path, base_url: str) -> None:
+        self.directory = Path(directory)
+        self.base_url = base_url
+        key = hashlib.sha1(base_url.encode()).hexdigest()[:16]
+        self.path = self.directory / f"{key}.json"
+
+    def load(self) -> Optional[CachedSnapshot]:
+        """Get the cached snapshot, or `None` if there is none (or it's unreadable)."""
+        try:
+            with self.path.open("rb") as file:
+                cached = json.load(file)
+            return CachedSnapshot(
+                cached["stations"], cached["fetched_at"], cached["ttl"]
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(
+        self,
+        stations: Iterable[Record],
+        ttl: int,
+        fetched_at: Optional[float] = None,
+    ) -> CachedSnapshot:
+        """Replace the cached snapshot. The file is replaced atomically, so concurrent readers never see partial writes."""
+        snapshot = CachedSnapshot(
+            list(stations), time.time() if fetched_at is None else fetched_at, ttl
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with temporary.open("w", encoding="utf-8") as file:
+                json.dump(
+                    {
+                        "base_url": self.base_url,
+                        "fetched_at": snapshot.fetched_at,
+                        "ttl": snapshot.ttl,
+                        "stations": snapshot.stations,
+                    },
+                    file,
+                    ensure_ascii=False,
+                )
+            os.replace(temporary, self.path)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+        return snapshot
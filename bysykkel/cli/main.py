@@ -1,30 +1,158 @@
-import asyncio
+"""Command line interface for querying Oslo Bysykkel, or other GBFS systems.
 
-from rich.table import Table
-from rich.console import Console
-from rich import box
+The HTTP client, the pydantic models and rich are only imported by the commands which need them,
+so e.g. a `bysykkel list` answered from the on-disk snapshot cache starts quickly.
+"""
+
+import csv
+import heapq
+import json
+import sys
+from dataclasses import dataclass
+from enum import Enum
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
 
 import typer
 
-from bysykkel.client import BysykkelClient
+from bysykkel.cli.cache import (
+    Record,
+    SnapshotFileCache,
+    default_cache_dir,
+    station_record,
+)
 
 app = typer.Typer(name="bysykkel")
 
+# Seconds to cache the stations for, if the feeds don't have a `ttl`
+DEFAULT_TTL = 10
+
+
+class OutputFormat(str, Enum):
+    table = "table"
+    json = "json"
+    csv = "csv"
+
+
+@dataclass
+class Config:
+    base_url: str
+    cache_dir: Path
+
 
 @app.callback()
-def create_client(
+def configure(
     ctx: typer.Context,
     base_url: str = "https://gbfs.urbansharing.com/oslobysykkel.no",
+    cache_dir: Path = typer.Option(
+        default_cache_dir(),
+        envvar="BYSYKKEL_CACHE_DIR",
+        help="Directory of the on-disk snapshot cache.",
+    ),
 ):
+    ctx.obj = Config(base_url, cache_dir)
+
+
+async def fetch_stations(base_url: str) -> Tuple[List[Record], int]:
+    """Query the stations, and the shortest `ttl` of the feeds."""
+    from bysykkel.client import BysykkelClient
 
     client = BysykkelClient(base_url)
-    ctx.obj = client
+    try:
+        status, info = await client.get_station_feeds()
+        stations = client.merge_stations(status, info)
+    finally:
+        await client.aclose()
+    ttls = [ttl for ttl in (status.ttl, info.ttl) if ttl is not None]
+    return [station_record(station) for station in stations], (
+        min(ttls) if ttls else DEFAULT_TTL
+    )
 
 
-@app.command("list")
-def list_stations(ctx: typer.Context, pretty: bool = False):
-    client: BysykkelClient = ctx.obj
-    stations = asyncio.run(client.get_stations())
+def load_stations(
+    config: Config, max_age: Optional[int] = None, offline: bool = False
+) -> List[Record]:
+    """Get the stations from the on-disk cache if they're fresh enough, or else query and cache them.
+
+    Cached stations are fresh for the feed `ttl`, or for `max_age` seconds if given.
+    If `offline`, cached stations are used regardless of their age.
+    """
+    cache = SnapshotFileCache(config.cache_dir, config.base_url)
+    cached = cache.load()
+    if cached is not None and (
+        offline or cached.age <= (cached.ttl if max_age is None else max_age)
+    ):
+        return cached.stations
+    if offline:
+        typer.echo(f"No cached stations for {config.base_url}", err=True)
+        raise typer.Exit(1)
+
+    import asyncio
+
+    stations, ttl = asyncio.run(fetch_stations(config.base_url))
+    try:
+        cache.store(stations, ttl)
+    except OSError as e:
+        typer.echo(f"Failed to cache stations: {e}", err=True)
+    return stations
+
+
+def select_stations(
+    stations: List[Record],
+    min_bikes: int = 0,
+    min_docks: int = 0,
+    search: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[Record]:
+    """Filter, sort and limit stations, before they're rendered.
+
+    `sort` is a field name, prefixed with `-` for descending order. Stations without a value for it are sorted last.
+    With a `limit`, only the top stations are sorted.
+    """
+    if min_bikes or min_docks or search:
+        needle = search.casefold() if search else ""
+        stations = [
+            station
+            for station in stations
+            if station["num_bikes_available"] >= min_bikes
+            and station["num_docks_available"] >= min_docks
+            and (
+                needle in (station["name"] or "").casefold()
+                or needle in (station["address"] or "").casefold()
+            )
+        ]
+
+    if sort:
+        field, descending = sort.removeprefix("-"), sort.startswith("-")
+        present = [station for station in stations if station.get(field) is not None]
+        missing = [station for station in stations if station.get(field) is None]
+        key = itemgetter(field)
+        if limit is not None and limit < len(present):
+            top = heapq.nlargest if descending else heapq.nsmallest
+            present = top(limit, present, key=key)
+        else:
+            present.sort(key=key, reverse=descending)
+        stations = present + missing
+
+    if limit is not None:
+        stations = stations[:limit]
+    return stations
+
+
+def check_fields(stations: List[Record], *fields: Optional[str]) -> None:
+    """Raise a `BadParameter` error if any of the given fields is not a station field."""
+    if not stations:
+        return
+    for field in fields:
+        if field and field.removeprefix("-") not in stations[0]:
+            raise typer.BadParameter(f"Unknown station field: {field}")
+
+
+def station_table(stations: List[Record], pretty: bool = False) -> Any:
+    from rich import box
+    from rich.table import Table
 
     table = Table(title="Bysykler", box=box.MINIMAL_DOUBLE_HEAD if pretty else None)
     table.add_column("Stativ")
@@ -34,13 +162,142 @@ def list_stations(ctx: typer.Context, pretty: bool = False):
 
     for station in stations:
         table.add_row(
-            station.name,
-            station.address,
-            str(station.num_bikes_available),
-            str(station.num_docks_available),
+            station["name"],
+            station["address"],
+            str(station["num_bikes_available"]),
+            str(station["num_docks_available"]),
         )
+    return table
+
+
+def print_stations(
+    stations: List[Record],
+    format: OutputFormat,
+    fields: Optional[List[str]] = None,
+    pretty: bool = False,
+) -> None:
+    if format is OutputFormat.table:
+        from rich.console import Console
+
+        Console().print(station_table(stations, pretty))
+        return
+
+    if fields is None:
+        fields = list(stations[0]) if stations else []
+    rows = [{field: station[field] for field in fields} for station in stations]
+    if format is OutputFormat.json:
+        sys.stdout.write(json.dumps(rows, ensure_ascii=False) + "\n")
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@app.command("list")
+def list_stations(
+    ctx: typer.Context,
+    pretty: bool = False,
+    format: OutputFormat = typer.Option(OutputFormat.table, help="Output format."),
+    fields: Optional[str] = typer.Option(
+        None, help="Comma-separated fields to output as JSON or CSV."
+    ),
+    min_bikes: int = typer.Option(0, help="Only list stations with this many bikes."),
+    min_docks: int = typer.Option(0, help="Only list stations with this many docks."),
+    search: Optional[str] = typer.Option(
+        None, help="Only list stations with this in their name or address."
+    ),
+    sort: Optional[str] = typer.Option(
+        None, help="Field to sort by, prefixed with - for descending order."
+    ),
+    limit: Optional[int] = typer.Option(None, help="Max number of stations to list."),
+    max_age: Optional[int] = typer.Option(
+        None,
+        help="Max age in seconds of cached stations to use. Defaults to the feed ttl. 0 always queries.",
+    ),
+    offline: bool = typer.Option(
+        False, help="Use the cached stations regardless of their age, without querying."
+    ),
+):
+    """List the stations and their availability."""
+    stations = load_stations(ctx.obj, max_age, offline)
+    field_names = fields.split(",") if fields else None
+    check_fields(stations, sort, *(field_names or ()))
+    stations = select_stations(stations, min_bikes, min_docks, search, sort, limit)
+    print_stations(stations, format, field_names, pretty)
+
+
+async def watch(
+    config: Config,
+    pretty: bool,
+    json_lines: bool,
+    select: Any,
+) -> None:
+    """Output the stations on every change.
+
+    Failed queries are retried by `BysykkelClient.watch()`, which logs them as warnings.
+    They're shown above the table (or on stderr with `json_lines`),
+    and the last stations stay on screen until the next successful query.
+    """
+    import logging
+
+    from bysykkel.client import BysykkelClient
+
+    # A single client is reused for every query, so its connections are kept alive.
+    client = BysykkelClient(config.base_url)
+    try:
+        if json_lines:
+            logging.basicConfig(level=logging.WARNING)
+            async for diff in client.watch():
+                stations = select(list(map(station_record, diff.stations)))
+                sys.stdout.write(json.dumps(stations, ensure_ascii=False) + "\n")
+                sys.stdout.flush()
+            return
+
+        from rich.live import Live
+        from rich.logging import RichHandler
+
+        with Live(auto_refresh=False) as live:
+            # Log above the live table, instead of garbling it
+            logging.basicConfig(
+                level=logging.WARNING,
+                format="%(message)s",
+                handlers=[RichHandler(console=live.console)],
+            )
+            async for diff in client.watch():
+                stations = select(list(map(station_record, diff.stations)))
+                live.update(station_table(stations, pretty), refresh=True)
+    finally:
+        await client.aclose()
+
+
+@app.command("watch")
+def watch_stations(
+    ctx: typer.Context,
+    pretty: bool = False,
+    json_lines: bool = typer.Option(
+        False, "--json", help="Output a JSON list of the stations on every change."
+    ),
+    min_bikes: int = typer.Option(0, help="Only list stations with this many bikes."),
+    min_docks: int = typer.Option(0, help="Only list stations with this many docks."),
+    search: Optional[str] = typer.Option(
+        None, help="Only list stations with this in their name or address."
+    ),
+    sort: Optional[str] = typer.Option(
+        None, help="Field to sort by, prefixed with - for descending order."
+    ),
+    limit: Optional[int] = typer.Option(None, help="Max number of stations to list."),
+):
+    """List the stations, and refresh the list in place whenever they change."""
+    import asyncio
+
+    def select(stations: List[Record]) -> List[Record]:
+        check_fields(stations, sort)
+        return select_stations(stations, min_bikes, min_docks, search, sort, limit)
 
-    Console().print(table)
+    try:
+        asyncio.run(watch(ctx.obj, pretty, json_lines, select))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -1,70 +1,498 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
 from logging import getLogger
-from typing import List
+from time import monotonic, perf_counter
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 from urllib.parse import urlparse
 
-from pydantic import parse_obj_as
-from httpx import AsyncClient
+from pydantic import BaseModel
+from httpx import (
+    AsyncClient,
+    HTTPError,
+    HTTPStatusError,
+    Limits,
+    Response,
+    Timeout,
+    TransportError,
+)
 
-from bysykkel.models import StationData, StationInfoResponse, StationStatusReponse
+from bysykkel import metrics
+from bysykkel.models import (
+    StationCollection,
+    StationData,
+    StationInfoResponse,
+    StationStatus,
+    StationStatusReponse,
+)
+from bysykkel.parsing import loads, parse_station_information, parse_station_status
+
+FeedResponse = TypeVar("FeedResponse", bound=BaseModel)
+
+
+@dataclass
+class _CachedFeed:
+    """The most recent response from a feed, along with its cache validators."""
+
+    etag: Optional[str]
+    last_modified: Optional[str]
+    last_updated: Any
+    response: BaseModel
+
+
+# Fields which can change without `station_information.json` changing
+STATUS_FIELDS = tuple(name for name in StationStatus.__fields__ if name != "station_id")
+DIFF_FIELDS = tuple(name for name in StationData.__fields__ if name != "station_id")
+
+
+@dataclass
+class StationDiff:
+    """Changes between two station collections.
+
+    `changed` maps the `station_id` of each changed station to its changed fields and their new values.
+    `stations` holds the newer of the two collections.
+    """
+
+    stations: StationCollection
+    added: List[StationData] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_stations(
+    old: StationCollection,
+    new: StationCollection,
+    fields: Optional[Iterable[str]] = None,
+    info_changed: bool = True,
+) -> StationDiff:
+    """Compare two station collections by `station_id`.
+
+    Only the given `fields` (by default all fields) are compared.
+    If the station info is known to be unchanged (`info_changed=False`), only the status fields are compared.
+    Stations are compared in a single pass over `new`, and only changed stations allocate anything.
+    """
+    names = tuple(fields) if fields is not None else DIFF_FIELDS
+    if not info_changed:
+        names = tuple(name for name in names if name in STATUS_FIELDS)
+
+    diff = StationDiff(new)
+    for station in new:
+        old_station = old.get(station.station_id)
+        if old_station is None:
+            diff.added.append(station)
+        elif old_station is not station:
+            old_values, new_values = old_station.__dict__, station.__dict__
+            for name in names:
+                if old_values[name] != new_values[name]:
+                    changes = diff.changed.setdefault(station.station_id, {})
+                    changes[name] = new_values[name]
+
+    if len(new) - len(diff.added) != len(old):
+        diff.removed = [station_id for station_id in old.ids() if station_id not in new]
+    return diff
+
+
+def station_id_key(station_id: str) -> Tuple[int, int, str]:
+    """Sort key of station ids, which orders numeric ids numerically, before any other ids."""
+    if station_id.isdecimal():
+        return 0, int(station_id), station_id
+    return 1, 0, station_id
+
+
+class UpstreamError(Exception):
+    """Raised when querying upstream fails, e.g. on timeouts, error responses or malformed feeds."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised instead of querying upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops querying upstream for `reset_timeout` seconds after `failure_threshold` consecutive failed queries.
+
+    When the timeout has passed, queries are let through again (half-open):
+    The first successful query closes the breaker, while the first failed query opens it again.
+
+    Reference:
+        Circuit breaker: https://martinfowler.com/bliki/CircuitBreaker.html
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return (
+            self.opened_at is not None
+            and monotonic() - self.opened_at < self.reset_timeout
+        )
+
+    def before_call(self) -> None:
+        """Raise `CircuitOpenError` if the breaker is open."""
+        if self.is_open:
+            remaining = self.reset_timeout - (monotonic() - self.opened_at)  # type: ignore
+            raise CircuitOpenError(
+                f"Circuit breaker is open after {self.failures} failures, retrying in {remaining:.0f}s"
+            )
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
 
 
 class BysykkelClient:
     """Client class for reading from Oslo Bysykkel's real time API.
 
-    NOTE: Oslo Bysykkel provides a GBFS auto discovery schema,
-          which could be used to resolve URLs to other endpoints.
-          That'd enable supporting other GBFS data providers with the same client.
+    With `discovery=True`, the feed URLs are resolved from the GBFS auto discovery file (`gbfs.json`),
+    so the client can read from other GBFS data providers whose feeds aren't at `<base_url>/<feed>.json`.
 
     Reference:
         Oslo Bysykkel: https://oslobysykkel.no/apne-data/sanntid
+        GBFS gbfs.json: https://github.com/MobilityData/gbfs/blob/df473ca4adbff982d67b50ac00b625191591d8f8/gbfs.md#gbfsjson
     """
 
     def __init__(
-        self, base_url: str, client_identifier: str = "eirikeve-bysykkel"
+        self,
+        base_url: str,
+        client_identifier: str = "eirikeve-bysykkel",
+        timeout: float = 5.0,
+        limits: Optional[Limits] = None,
+        http2: bool = False,
+        session: Optional[AsyncClient] = None,
+        discovery: bool = False,
+        language: str = "en",
+        retries: int = 2,
+        retry_backoff: float = 0.2,
+        breaker: Optional[CircuitBreaker] = None,
     ) -> None:
+        """
+        Args:
+            base_url: URL which the GBFS endpoints are relative to.
+            client_identifier: Identifies this client to Oslo Bysykkel, sent in the `Client-Identifier` header.
+            timeout: Timeout in seconds for connecting to, reading from and writing to upstream.
+            limits: Connection pool limits. Uses httpx' defaults if not set.
+            http2: Whether to use HTTP/2 if upstream supports it. Requires `httpx[http2]`.
+            session: HTTP session to use instead of opening one, e.g. to share a connection pool between clients.
+                It isn't closed by `aclose()`, and the options above don't apply to it.
+            discovery: Whether to resolve the feed URLs from `<base_url>/gbfs.json` before the first query.
+            language: Preferred language of the discovered feeds. Falls back to the first language available.
+            retries: Number of times to retry a query on connection errors, timeouts and 429/5xx responses.
+            retry_backoff: Base delay in seconds between retries. The delay doubles on every retry, and is jittered.
+            breaker: Circuit breaker around the feed queries. Uses a `CircuitBreaker` with default settings if not set.
+        """
         self.base_url = urlparse(base_url)
-        self.session = AsyncClient(headers={"Client-Identifier": client_identifier})
+        self.discovery = discovery
+        self.language = language
+        self.feed_urls: Optional[Dict[str, str]] = None
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._discovery: Optional[asyncio.Task] = None
+        self._session_options = dict(
+            headers={"Client-Identifier": client_identifier},
+            timeout=Timeout(timeout),
+            http2=http2,
+        )
+        if limits is not None:
+            self._session_options["limits"] = limits
+        self._session: Optional[AsyncClient] = session
+        self._owns_session = session is None
+        self._feeds: Dict[str, _CachedFeed] = {}
         self.logger = getLogger(type(self).__name__)
         self.logger.info(f"Initialized with base_url {base_url}")
         # TODO: Add more (granular) logging
 
+    @property
+    def session(self) -> AsyncClient:
+        """HTTP session which pools and keeps alive connections across requests.
+
+        The session is opened on first use, and reopened on use after `aclose()`.
+        A session given by the caller is never replaced, so a `RuntimeError` is raised if it's closed.
+        """
+        if self._session is not None and self._session.is_closed:
+            if not self._owns_session:
+                raise RuntimeError("The HTTP session given to the client is closed")
+            self._session = None
+        if self._session is None:
+            self._session = AsyncClient(**self._session_options)
+        return self._session
+
+    async def aclose(self) -> None:
+        """Close the HTTP session and its pooled connections, unless the session was given by the caller."""
+        if self._session is not None and self._owns_session:
+            await self._session.aclose()
+            self._session = None
+
+    async def __aenter__(self) -> "BysykkelClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
     def url(self, endpoint: str) -> str:
         endpoint = endpoint.removeprefix("/")
         full_path = f"{self.base_url.path}/{endpoint}"
         return self.base_url._replace(path=full_path).geturl()
 
-    async def get_station_information(self) -> StationInfoResponse:
-        """Query for info/metadata of the available city bike stations."""
-        url: str = self.url("/station_information.json")
+    async def discover(self) -> Dict[str, str]:
+        """Query the GBFS auto discovery file for the URLs of the available feeds, by feed name.
+
+        The discovered URLs are used for all following feed queries.
+        """
+        url = self.url("/gbfs.json")
         self.logger.info(f"GET: {url}")
         response = await self.session.get(url)
-        self.logger.debug(f"GET: {url} -> {response}")
+        response.raise_for_status()
+        data = loads(response.content)["data"]
+        # GBFS v1 and v2 group the feeds by language, while v3 only has one list of feeds.
+        if "feeds" not in data:
+            data = data.get(self.language) or next(iter(data.values()))
+        self.feed_urls = {feed["name"]: feed["url"] for feed in data["feeds"]}
+        self.logger.info(f"Discovered feeds {', '.join(self.feed_urls)}")
+        return self.feed_urls
 
-        return parse_obj_as(StationInfoResponse, response.json())
+    async def feed_url(self, name: str) -> str:
+        """Get the URL of a feed, e.g. `station_status`, discovering the feed URLs first if enabled.
+
+        Concurrent queries share a single discovery, and a failed discovery is retried on the next query.
+        """
+        if self.discovery and self.feed_urls is None:
+            if self._discovery is None:
+                self._discovery = asyncio.ensure_future(self.discover())
+                self._discovery.add_done_callback(self._discovery_done)
+            await asyncio.shield(self._discovery)
+        if self.feed_urls and name in self.feed_urls:
+            return self.feed_urls[name]
+        return self.url(f"/{name}.json")
+
+    def _discovery_done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None:
+            self._discovery = None
+
+    async def get_station_information(self) -> StationInfoResponse:
+        """Query for info/metadata of the available city bike stations.
+
+        If the feed is unchanged since the previous query, the previous response object is returned.
+        """
+        return await self._get_feed("station_information", parse_station_information)
 
     async def get_station_status(self) -> StationStatusReponse:
-        """Query for the current status of the available city bike stations."""
+        """Query for the current status of the available city bike stations.
 
-        url = self.url("/station_status.json")
-        self.logger.info(f"GET: {url}")
-        response = await self.session.get(url)
-        self.logger.debug(f"GET: {url} -> {response}")
+        If the feed is unchanged since the previous query, the previous response object is returned.
+        """
+        return await self._get_feed("station_status", parse_station_status)
+
+    async def _get_feed(
+        self, name: str, parse: Callable[[Any], FeedResponse]
+    ) -> FeedResponse:
+        """Query a GBFS feed through the circuit breaker.
+
+        Raises `UpstreamError` if the query fails, or `CircuitOpenError` without querying if the breaker is open.
+        """
+        self.breaker.before_call()
+        start = perf_counter()
+        try:
+            parsed = await self._query_feed(name, parse)
+        except (HTTPError, ValueError, KeyError) as e:
+            self.breaker.record_failure()
+            if metrics.enabled:
+                metrics.UPSTREAM_FETCHES.labels(name, "error").inc()
+            raise UpstreamError(f"Failed to query the {name} feed: {e!r}") from e
+        self.breaker.record_success()
+        if metrics.enabled:
+            metrics.UPSTREAM_FETCH_SECONDS.labels(name).observe(perf_counter() - start)
+        return parsed
+
+    async def _query_feed(
+        self, name: str, parse: Callable[[Any], FeedResponse]
+    ) -> FeedResponse:
+        """Query a GBFS feed, skipping parsing if it's unchanged since the previous query.
+
+        The query is conditional on the previous response's `ETag`/`Last-Modified` headers (if any),
+        and a response is considered unchanged if it's a `304 Not Modified`, or has the same `last_updated`.
+        Callers can detect this by checking if the returned object `is` the previously returned object.
+        """
+        url = await self.feed_url(name)
+        cached = self._feeds.get(url)
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
 
-        return parse_obj_as(StationStatusReponse, response.json())
+        response = await self._get(url, headers)
+        if cached is not None and response.status_code == 304:
+            self.logger.debug(f"GET: {url} -> Unchanged (not modified)")
+            if metrics.enabled:
+                metrics.UPSTREAM_FETCHES.labels(name, "not_modified").inc()
+            return cached.response  # type: ignore
+        response.raise_for_status()
 
-    async def get_stations(self) -> List[StationData]:
+        start = perf_counter()
+        body = loads(response.content)
+        last_updated = body.get("last_updated") if isinstance(body, dict) else None
+        if (
+            cached is not None
+            and last_updated is not None
+            and last_updated == cached.last_updated
+        ):
+            self.logger.debug(f"GET: {url} -> Unchanged (same last_updated)")
+            parsed = cached.response
+            result = "unchanged"
+        else:
+            parsed = parse(body)
+            result = "updated"
+        if metrics.enabled:
+            metrics.PARSE_SECONDS.labels(name).observe(perf_counter() - start)
+            metrics.UPSTREAM_FETCHES.labels(name, result).inc()
+            metrics.UPSTREAM_RESPONSE_BYTES.labels(name).observe(len(response.content))
+
+        self._feeds[url] = _CachedFeed(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            last_updated=last_updated,
+            response=parsed,
+        )
+        return parsed  # type: ignore
+
+    async def _get(self, url: str, headers: Dict[str, str]) -> Response:
+        """GET a URL, retrying connection errors, timeouts and 429/5xx responses.
+
+        Retries back off exponentially with full jitter, so clients recovering from the same outage don't retry in sync.
+
+        Reference:
+            Exponential backoff and jitter: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        """
+        for attempt in range(self.retries + 1):
+            self.logger.info(f"GET: {url}")
+            try:
+                response = await self.session.get(url, headers=headers)
+                self.logger.debug(f"GET: {url} -> {response}")
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+            except (TransportError, HTTPStatusError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = random.uniform(0, self.retry_backoff * 2**attempt)
+                self.logger.warning(f"GET: {url} -> {e!r}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def get_station_feeds(
+        self, info: Optional[StationInfoResponse] = None
+    ) -> Tuple[StationStatusReponse, StationInfoResponse]:
+        """Query for the station status and info/metadata concurrently.
+
+        If `info` is given, e.g. because the caller holds metadata that's still fresh, only the status is queried.
+        If either query fails, the other is cancelled.
+        """
+        if info is not None:
+            return await self.get_station_status(), info
+
+        status_task = asyncio.ensure_future(self.get_station_status())
+        info_task = asyncio.ensure_future(self.get_station_information())
+        try:
+            done, _ = await asyncio.wait(
+                (status_task, info_task), return_when=asyncio.FIRST_EXCEPTION
+            )
+        finally:
+            # Only has an effect if a query failed, or we were cancelled while waiting.
+            status_task.cancel()
+            info_task.cancel()
+            # Wait for the cancelled query to finish, and retrieve the exceptions of both,
+            # so neither is left running or logged as never retrieved.
+            await asyncio.gather(status_task, info_task, return_exceptions=True)
+
+        for task in done:
+            exception = task.exception()
+            if exception is not None:
+                raise exception
+        return status_task.result(), info_task.result()
+
+    async def get_stations(
+        self, info: Optional[StationInfoResponse] = None
+    ) -> StationCollection:
         """Query for info/metadata and current status for the available city bike stations.
 
         The station info and station status are merged by id, so all data for each station is contained in one object.
+        The returned collection can be iterated over, or indexed by `station_id`.
+        If `info` is given, only the current status is queried, and merged with the given info.
+        """
+
+        status, info = await self.get_station_feeds(info)
+        return self.merge_stations(status, info)
+
+    async def watch(
+        self, fields: Optional[Iterable[str]] = None, default_ttl: int = 10
+    ) -> AsyncIterator[StationDiff]:
+        """Poll the feeds, and yield the changes to the stations whenever they change.
+
+        The first diff has all the stations as added. The feeds are polled according to the status feed's `ttl`,
+        or every `default_ttl` seconds if it has none. See `diff_stations()` for the `fields` compared.
+        Failed polls are logged and retried after `default_ttl` seconds.
+
+        Example:
+            >>> async for diff in client.watch(fields=["num_bikes_available"]):
+            ...     print(diff.changed)
         """
+        stations = StationCollection()
+        status: Optional[StationStatusReponse] = None
+        info: Optional[StationInfoResponse] = None
+        while True:
+            try:
+                new_status, new_info = await self.get_station_feeds()
+            except UpstreamError as e:
+                # Keep the previous stations, and try again later.
+                self.logger.warning(f"Failed to poll station feeds: {e!r}")
+                await asyncio.sleep(default_ttl)
+                continue
+            # Unchanged feeds are returned as the same objects as before
+            if new_status is not status or new_info is not info:
+                new_stations = self.merge_stations(new_status, new_info)
+                diff = diff_stations(
+                    stations, new_stations, fields, info_changed=new_info is not info
+                )
+                stations, status, info = new_stations, new_status, new_info
+                if diff:
+                    yield diff
+            await asyncio.sleep(new_status.ttl or default_ttl)
 
-        status = await self.get_station_status()
-        info = await self.get_station_information()
+    def merge_stations(
+        self, status: StationStatusReponse, info: StationInfoResponse
+    ) -> StationCollection:
+        """Merge station status and station info by id.
 
-        status_by_id = {
-            entry.station_id: entry.dict() for entry in status.data.stations
-        }
-        info_by_id = {entry.station_id: entry.dict() for entry in info.data.stations}
+        Stations which are missing either a status or metadata are left out.
+        The stations are ordered by `station_id` (numerically, for numeric ids),
+        so the order is the same for every query, regardless of the order of the feeds.
+        """
+        start = perf_counter()
+
+        status_by_id = {entry.station_id: entry for entry in status.data.stations}
+        info_by_id = {entry.station_id: entry for entry in info.data.stations}
 
         stations_with_status = set(status_by_id)
         stations_with_info = set(info_by_id)
@@ -84,8 +512,16 @@ class BysykkelClient:
                     f"{len(missing_status)} stations have metadata but no status: {missing_status}"
                 )
 
-        station_data = [
-            {**info_by_id[station_id], **status_by_id[station_id]}
-            for station_id in stations_with_info_and_status
-        ]
-        return parse_obj_as(List[StationData], station_data)
+        # Both feeds are already validated, so the merged fields don't need validating again.
+        stations = StationCollection(
+            StationData.construct(
+                **{
+                    **info_by_id[station_id].__dict__,
+                    **status_by_id[station_id].__dict__,
+                }
+            )
+            for station_id in sorted(stations_with_info_and_status, key=station_id_key)
+        )
+        if metrics.enabled:
+            metrics.MERGE_SECONDS.observe(perf_counter() - start)
+        return stations
@@ -0,0 +1,184 @@
+import heapq
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    KeysView,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from bysykkel.client import station_id_key
+from bysykkel.models import StationCollection, StationData
+
+# Array typecodes of the numeric station fields. `last_reported` is stored as a POSIX timestamp.
+NUMERIC_COLUMNS = {
+    "is_installed": "b",
+    "is_renting": "b",
+    "is_returning": "b",
+    "num_bikes_available": "l",
+    "num_docks_available": "l",
+    "capacity": "l",
+    "lat": "d",
+    "lon": "d",
+    "last_reported": "d",
+}
+STRING_COLUMNS = ("station_id", "name", "address")
+
+Column = Union[array, List[Optional[str]]]
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
+class StationColumns:
+    """Column-oriented store of station data.
+
+    Numeric fields are stored in typed arrays, and string fields in lists of interned strings,
+    so a snapshot takes a fraction of the memory of the equivalent `StationData` objects,
+    and filters and sorting can be evaluated over whole columns at a time.
+    Rows are only materialised as `StationData` objects on access, see `ColumnarStationCollection`.
+    Orderings of the rows by a field are computed on first use, and kept for the lifetime of the store.
+
+    Example:
+        >>> columns = StationColumns.from_stations(stations)
+        >>> columns["num_bikes_available"][columns.index["627"]]
+        >>> columns.station(columns.index["627"])
+    """
+
+    def __init__(self, columns: Dict[str, Column]) -> None:
+        self.columns = columns
+        self.index: Dict[str, int] = {
+            station_id: row for row, station_id in enumerate(columns["station_id"])
+        }
+        self._orderings: Dict[Tuple[str, bool], array] = {}
+
+    @classmethod
+    def from_stations(cls, stations: Iterable[StationData]) -> "StationColumns":
+        columns: Dict[str, Column] = {name: [] for name in STRING_COLUMNS}
+        columns.update(
+            {name: array(typecode) for name, typecode in NUMERIC_COLUMNS.items()}
+        )
+        for station in stations:
+            for name in STRING_COLUMNS:
+                columns[name].append(_intern(getattr(station, name)))
+            for name in NUMERIC_COLUMNS:
+                if name == "last_reported":
+                    columns[name].append(station.last_reported.timestamp())
+                else:
+                    columns[name].append(getattr(station, name))
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, name: str) -> Column:
+        """Get a column by field name."""
+        return self.columns[name]
+
+    def __contains__(self, station_id: object) -> bool:
+        return station_id in self.index
+
+    def rows(self, station_ids: Iterable[str]) -> List[int]:
+        """Get the rows of the stations with the given ids, in the same order.
+
+        Unknown and repeated ids are left out.
+        """
+        index = self.index
+        return [
+            index[station_id]
+            for station_id in dict.fromkeys(station_ids)
+            if station_id in index
+        ]
+
+    def ordering(self, field: str, descending: bool = False) -> array:
+        """Get all the rows, ordered by a field. Rows with equal values keep their order, and missing values are last.
+
+        The ordering is only computed once per field and direction.
+        """
+        key = (field, descending)
+        if key not in self._orderings:
+            self._orderings[key] = array(
+                "l", self.sort_rows(range(len(self)), field, descending)
+            )
+        return self._orderings[key]
+
+    def sort_rows(
+        self,
+        rows: Iterable[int],
+        field: str,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """Order some of the rows by a field, like `ordering()` does.
+
+        If only the first `limit` rows are needed, they're picked with a heap instead of sorting all the rows.
+        Station ids are ordered by `station_id_key()`, like the default order of the stations.
+        """
+        column = self.columns[field]
+        key: Callable[[int], Any] = (
+            (lambda row: station_id_key(column[row]))  # type: ignore
+            if field == "station_id"
+            else column.__getitem__
+        )
+        rows = list(rows)
+        present = [row for row in rows if column[row] is not None]
+        missing = [row for row in rows if column[row] is None]
+        if limit is not None and limit < len(present):
+            top = heapq.nlargest if descending else heapq.nsmallest
+            present = top(limit, present, key=key)
+        else:
+            # Sorting is stable, also in reverse, so equal values keep their order.
+            present.sort(key=key, reverse=descending)
+        return (present + missing)[:limit]
+
+    def station(self, row: int) -> StationData:
+        """Materialise a single row as a `StationData` object."""
+        fields = {name: self.columns[name][row] for name in StationData.__fields__}
+        fields["last_reported"] = datetime.fromtimestamp(
+            fields["last_reported"], tz=timezone.utc
+        )
+        return StationData.construct(**fields)
+
+
+class ColumnarStationCollection(StationCollection):
+    """Station collection backed by `StationColumns`, in the order of the columns.
+
+    Stations are materialised as new `StationData` objects whenever they're accessed, and aren't kept,
+    so only the columns take up memory for as long as the collection is held.
+    """
+
+    def __init__(self, columns: StationColumns) -> None:
+        self.columns = columns
+
+    def __getitem__(self, station_id: str) -> StationData:
+        return self.columns.station(self.columns.index[station_id])
+
+    def __contains__(self, station_id: object) -> bool:
+        return station_id in self.columns
+
+    def __iter__(self) -> Iterator[StationData]:
+        return map(self.columns.station, range(len(self.columns)))
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def get(
+        self, station_id: str, default: Optional[StationData] = None
+    ) -> Optional[StationData]:
+        row = self.columns.index.get(station_id)
+        return default if row is None else self.columns.station(row)
+
+    def ids(self) -> KeysView[str]:
+        return self.columns.index.keys()
+
+    def rows(self, rows: Iterable[int]) -> Iterator[StationData]:
+        return map(self.columns.station, rows)
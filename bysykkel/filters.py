@@ -0,0 +1,161 @@
+"""Filtering of stations by their numeric fields.
+
+Filter expressions are parsed once into conditions, and evaluated over whole columns
+of a `StationColumns` store at a time. Supported expressions, e.g. for `num_bikes_available`:
+
+- `5` or `==5`: Equal to 5
+- `!=5`: Not equal to 5
+- `<5`, `<=5`, `>5`, `>=5`: Comparisons
+- `5..10`: Between 5 and 10, inclusive. Either bound may be left out, e.g. `5..`
+- `1,2,3`: Any of 1, 2 or 3
+- `true` or `false`: For boolean fields like `is_renting`
+
+Compiled filters are cached, so repeated queries are only parsed once.
+"""
+
+import operator
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import compress, repeat
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+from bysykkel.columns import NUMERIC_COLUMNS, StationColumns
+from bysykkel.models import StationData
+
+FILTERABLE_FIELDS = tuple(NUMERIC_COLUMNS)
+
+# Longer operators first, so e.g. `<=` isn't parsed as `<`.
+OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "!=": operator.ne,
+    "==": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+BOOLEANS = {"true": 1, "false": 0}
+
+
+def _is_in(value: Any, values: frozenset) -> bool:
+    return value in values
+
+
+@dataclass(frozen=True)
+class Condition:
+    """Comparison of a station field against a fixed value, like `num_bikes_available >= 5`."""
+
+    field: str
+    op: Callable[[Any, Any], bool]
+    value: Any
+
+    def mask(self, columns: StationColumns) -> Iterator[bool]:
+        """Evaluate the condition for every station in `columns`."""
+        return map(self.op, columns[self.field], repeat(self.value))
+
+    def __call__(self, station: StationData) -> bool:
+        """Evaluate the condition for a single station."""
+        value = getattr(station, self.field)
+        if self.field == "last_reported":
+            value = value.timestamp()
+        return self.op(value, self.value)
+
+
+class StationFilter:
+    """Conjunction of conditions on station fields."""
+
+    def __init__(self, conditions: Tuple[Condition, ...]) -> None:
+        self.conditions = conditions
+
+    def rows(self, columns: StationColumns) -> List[int]:
+        """Get the rows in `columns` of the stations matching all the conditions."""
+        return list(self.iter_rows(columns))
+
+    def iter_rows(self, columns: StationColumns) -> Iterator[int]:
+        """Lazily get the rows in `columns` of the stations matching all the conditions."""
+        if not self.conditions:
+            return iter(range(len(columns)))
+
+        mask = self.conditions[0].mask(columns)
+        for condition in self.conditions[1:]:
+            mask = map(operator.and_, mask, condition.mask(columns))
+        return compress(range(len(columns)), mask)
+
+    def filter_rows(
+        self, columns: StationColumns, rows: Iterable[int]
+    ) -> Iterator[int]:
+        """Lazily get those of the given rows in `columns` matching all the conditions, in the same order.
+
+        Cheaper than `iter_rows()` when there are only a few rows to check, e.g. stations looked up by id.
+        """
+        checks = [
+            (columns[condition.field], condition.op, condition.value)
+            for condition in self.conditions
+        ]
+        return (
+            row
+            for row in rows
+            if all(op(column[row], value) for column, op, value in checks)
+        )
+
+    def __call__(self, station: StationData) -> bool:
+        """Check if a single station matches all the conditions."""
+        return all(condition(station) for condition in self.conditions)
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions)
+
+
+def _parse_value(field: str, value: str) -> Any:
+    value = value.strip()
+    typecode = NUMERIC_COLUMNS[field]
+    if typecode == "b" and value.lower() in BOOLEANS:
+        return BOOLEANS[value.lower()]
+    if typecode == "d":
+        return float(value)
+    return int(value)
+
+
+def parse_conditions(field: str, expression: str) -> Tuple[Condition, ...]:
+    """Parse a filter expression on a station field. Raises `ValueError` if it's unsupported."""
+    if field not in NUMERIC_COLUMNS:
+        raise ValueError(f"Unsupported filter field: {field}")
+
+    if ".." in expression:
+        lower, upper = expression.split("..", 1)
+        conditions = []
+        if lower:
+            conditions.append(Condition(field, operator.ge, _parse_value(field, lower)))
+        if upper:
+            conditions.append(Condition(field, operator.le, _parse_value(field, upper)))
+        if not conditions:
+            raise ValueError(f"Range without bounds: {expression}")
+        return tuple(conditions)
+
+    for symbol, op in OPERATORS.items():
+        if expression.startswith(symbol):
+            value = _parse_value(field, expression[len(symbol) :])
+            return (Condition(field, op, value),)
+
+    if "," in expression:
+        values = frozenset(
+            _parse_value(field, value) for value in expression.split(",")
+        )
+        return (Condition(field, _is_in, values),)
+
+    return (Condition(field, operator.eq, _parse_value(field, expression)),)
+
+
+@lru_cache(maxsize=1024)
+def compile_filter(expressions: Tuple[Tuple[str, str], ...]) -> StationFilter:
+    """Compile `(field, expression)` pairs into a filter matching stations that satisfy all of them.
+
+    Example:
+        >>> compile_filter((("num_bikes_available", ">=5"), ("is_renting", "true")))
+    """
+    return StationFilter(
+        tuple(
+            condition
+            for field, expression in expressions
+            for condition in parse_conditions(field, expression)
+        )
+    )
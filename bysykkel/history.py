@@ -0,0 +1,363 @@
+"""Append-only history of station status, stored in SQLite.
+
+Only changes are stored: A station's status is recorded when it differs from its previously recorded status,
+keyed by `(station_id, time)` where `time` is the station's `last_reported` POSIX timestamp.
+The table is clustered on that key, so it doubles as a per-station time index,
+and time range queries only read the rows of a single station within the range.
+As most stations are unchanged between two polls, months of 10 second polls fit comfortably on a single node.
+
+Availability rollups per station and hour of the week are maintained incrementally as statuses are recorded,
+so questions like "how often is a station empty at 08:00 on weekdays" are answered from at most 168 rows per station,
+rather than by scanning the raw history.
+
+References:
+    SQLite WITHOUT ROWID tables: https://www.sqlite.org/withoutrowid.html
+    SQLite write-ahead logging: https://www.sqlite.org/wal.html
+"""
+
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timezone, tzinfo
+from logging import getLogger
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from bysykkel.cache import StationSnapshot
+from bysykkel.models import (
+    StationCollection,
+    StationRollup,
+    StationStatus,
+    StationStatusSample,
+)
+
+# Recorded status fields, in column order
+SAMPLE_FIELDS = (
+    "is_installed",
+    "is_renting",
+    "is_returning",
+    "num_bikes_available",
+    "num_docks_available",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS station_status (
+    station_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    is_installed INTEGER NOT NULL,
+    is_renting INTEGER NOT NULL,
+    is_returning INTEGER NOT NULL,
+    num_bikes_available INTEGER NOT NULL,
+    num_docks_available INTEGER NOT NULL,
+    PRIMARY KEY (station_id, time)
+) WITHOUT ROWID
+"""
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS station_rollups (
+    station_id TEXT NOT NULL,
+    hour_of_week INTEGER NOT NULL,
+    observed_seconds REAL NOT NULL,
+    empty_seconds REAL NOT NULL,
+    full_seconds REAL NOT NULL,
+    bike_seconds REAL NOT NULL,
+    min_bikes INTEGER NOT NULL,
+    max_bikes INTEGER NOT NULL,
+    PRIMARY KEY (station_id, hour_of_week)
+) WITHOUT ROWID
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO station_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (station_id, hour_of_week) DO UPDATE SET
+    observed_seconds = observed_seconds + excluded.observed_seconds,
+    empty_seconds = empty_seconds + excluded.empty_seconds,
+    full_seconds = full_seconds + excluded.full_seconds,
+    bike_seconds = bike_seconds + excluded.bike_seconds,
+    min_bikes = MIN(min_bikes, excluded.min_bikes),
+    max_bikes = MAX(max_bikes, excluded.max_bikes)
+"""
+
+COLUMNS = ", ".join(SAMPLE_FIELDS)
+# Positions of the fields used by the rollups, in the recorded samples
+INSTALLED, BIKES, DOCKS = 0, 3, 4
+
+Timestamp = Union[datetime, int, float]
+
+
+def _timestamp(value: Timestamp) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def _rollup(row: Tuple[Any, ...]) -> StationRollup:
+    hour_of_week, observed, empty, full, bike_seconds, min_bikes, max_bikes = row
+    return StationRollup.construct(
+        weekday=hour_of_week // 24,
+        hour=hour_of_week % 24,
+        observed_minutes=observed / 60,
+        empty_minutes=empty / 60,
+        full_minutes=full / 60,
+        min_bikes=min_bikes,
+        mean_bikes=bike_seconds / observed if observed else 0.0,
+        max_bikes=max_bikes,
+    )
+
+
+def _sample(row: Tuple[int, ...]) -> StationStatusSample:
+    time, *values = row
+    return StationStatusSample.construct(
+        time=datetime.fromtimestamp(time, tz=timezone.utc),
+        **dict(zip(SAMPLE_FIELDS, values)),
+    )
+
+
+class HistoryStore:
+    """Append-only store of station status history in an SQLite database file.
+
+    The store is safe to use from multiple threads, e.g. to record from an executor while the event loop keeps serving.
+
+    Example:
+        >>> store = HistoryStore("history.sqlite3")
+        >>> store.record(snapshot.stations, snapshot.last_updated)
+        >>> store.history("627", start=1540219230, end=1540305630, resolution=3600)
+        >>> store.rollups("627")
+    """
+
+    def __init__(
+        self,
+        path: str,
+        tz: tzinfo = timezone.utc,
+        max_gap: int = 300,
+    ) -> None:
+        """
+        Args:
+            path: Path to the database file, which is created if it doesn't exist. Use `:memory:` for a temporary store.
+            tz: Timezone of the hours of the week in the rollups.
+            max_gap: Max seconds between two recordings for the time in between to count in the rollups,
+                so e.g. upstream outages aren't counted as the stations keeping their previous status.
+        """
+        self.path = path
+        self.tz = tz
+        self.max_gap = max_gap
+        self._last_time: Optional[int] = None
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(SCHEMA)
+            self._connection.execute(ROLLUP_SCHEMA)
+            # Latest recorded status per station, to only record changes.
+            # SQLite picks the other columns from the row with the `MAX(time)`.
+            self._last: Dict[str, Tuple[int, ...]] = {
+                station_id: tuple(values)
+                for station_id, _, *values in self._connection.execute(
+                    f"SELECT station_id, MAX(time), {COLUMNS} FROM station_status GROUP BY station_id"
+                )
+            }
+
+    def __len__(self) -> int:
+        """Number of recorded samples."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM station_status"
+            ).fetchone()[0]
+
+    def record(
+        self, stations: Iterable[StationStatus], time: Optional[Timestamp] = None
+    ) -> int:
+        """Record the status of the stations which changed since they were last recorded.
+
+        `time` is when the statuses were observed, e.g. the snapshot's `last_updated`,
+        and defaults to the latest `last_reported` of the stations.
+        The time since the previous recording is added to the rollups of each station's previous status.
+        Returns the number of recorded samples.
+        """
+        rows = []
+        changed = {}
+        latest = 0
+        for station in stations:
+            values = station.__dict__
+            sample = tuple(values[name] for name in SAMPLE_FIELDS)
+            reported = _timestamp(station.last_reported)
+            latest = max(latest, reported)
+            if self._last.get(station.station_id) != sample:
+                changed[station.station_id] = sample
+                rows.append((station.station_id, reported, *sample))
+
+        now = _timestamp(time) if time is not None else latest
+        rollups = self._rollup_rows(now)
+        if rows or rollups:
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO station_status (station_id, time, {COLUMNS}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(SAMPLE_FIELDS))})",
+                    rows,
+                )
+                self._connection.executemany(ROLLUP_UPSERT, rollups)
+        self._last.update(changed)
+        return len(rows)
+
+    def _rollup_rows(self, now: int) -> List[Tuple[Any, ...]]:
+        """Rollup increments for the time since the previous recording, in which the stations had their previous status."""
+        previous, self._last_time = self._last_time, max(now, self._last_time or now)
+        if previous is None or not 0 < now - previous <= self.max_gap:
+            return []
+
+        seconds = now - previous
+        when = datetime.fromtimestamp(previous, tz=self.tz)
+        hour_of_week = when.weekday() * 24 + when.hour
+        return [
+            (
+                station_id,
+                hour_of_week,
+                seconds,
+                seconds if sample[BIKES] == 0 else 0,
+                seconds if sample[DOCKS] == 0 else 0,
+                sample[BIKES] * seconds,
+                sample[BIKES],
+                sample[BIKES],
+            )
+            for station_id, sample in self._last.items()
+            if sample[INSTALLED]
+        ]
+
+    def history(
+        self,
+        station_id: str,
+        start: Timestamp,
+        end: Timestamp,
+        resolution: Optional[int] = None,
+    ) -> List[StationStatusSample]:
+        """Get the status history of a station between `start` and `end`, ordered by time.
+
+        The first sample is the station's status at `start`, i.e. the last one recorded at or before it.
+        If a `resolution` in seconds is given, there's at most one sample per `resolution` seconds after `start`,
+        which is the last recorded status within that interval.
+        """
+        start, end = _timestamp(start), _timestamp(end)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT time, {COLUMNS} FROM station_status "
+                "WHERE station_id = ? AND time <= ? ORDER BY time DESC LIMIT 1",
+                (station_id, start),
+            ).fetchall()
+            if resolution:
+                # SQLite picks the other columns from the row with the `MAX(time)` of each interval.
+                rows += self._connection.execute(
+                    f"SELECT MAX(time), {COLUMNS} FROM station_status "
+                    "WHERE station_id = ? AND time > ? AND time <= ? "
+                    "GROUP BY (time - ?) / ? ORDER BY MAX(time)",
+                    (station_id, start, end, start, resolution),
+                ).fetchall()
+            else:
+                rows += self._connection.execute(
+                    f"SELECT time, {COLUMNS} FROM station_status "
+                    "WHERE station_id = ? AND time > ? AND time <= ? ORDER BY time",
+                    (station_id, start, end),
+                ).fetchall()
+        return [_sample(row) for row in rows]
+
+    def rollups(
+        self,
+        station_id: str,
+        weekday: Optional[int] = None,
+        hour: Optional[int] = None,
+    ) -> List[StationRollup]:
+        """Get the availability rollups of a station per hour of the week, optionally only for a `weekday` or `hour`.
+
+        Weekdays are numbered from Monday (0) to Sunday (6), and hours are in the store's timezone.
+        """
+        conditions, parameters = ["station_id = ?"], [station_id]
+        if weekday is not None:
+            conditions.append("hour_of_week / 24 = ?")
+            parameters.append(weekday)
+        if hour is not None:
+            conditions.append("hour_of_week % 24 = ?")
+            parameters.append(hour)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT hour_of_week, observed_seconds, empty_seconds, full_seconds, bike_seconds, min_bikes, max_bikes "
+                f"FROM station_rollups WHERE {' AND '.join(conditions)} ORDER BY hour_of_week",
+                parameters,
+            ).fetchall()
+        return [_rollup(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class HistoryRecorder:
+    """Background task which records every new station snapshot in a `HistoryStore`.
+
+    Writes run in an executor, so they don't block the event loop.
+    """
+
+    def __init__(
+        self,
+        store: HistoryStore,
+        get_snapshot: Callable[[], Awaitable[StationSnapshot]],
+        retry_interval: int = 5,
+    ) -> None:
+        """
+        Args:
+            store: Store to record the snapshots in.
+            get_snapshot: Gets the current snapshot, e.g. `SnapshotCache.get` or `StationPoller.get`.
+            retry_interval: Seconds to wait before trying again if getting a snapshot fails.
+        """
+        self.store = store
+        self.get_snapshot = get_snapshot
+        self.retry_interval = retry_interval
+        self.logger = getLogger(type(self).__name__)
+        self._stations: Optional[StationCollection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def record(self, snapshot: StationSnapshot) -> int:
+        """Record a snapshot, unless it's the previously recorded one. Returns the number of recorded samples."""
+        if snapshot.stations is self._stations:
+            return 0
+        self._stations = snapshot.stations
+        loop = asyncio.get_running_loop()
+        count = await loop.run_in_executor(
+            None, self.store.record, snapshot.stations, snapshot.last_updated
+        )
+        self.logger.debug(f"Recorded {count} station status samples")
+        return count
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                snapshot = await self.get_snapshot()
+                await self.record(snapshot)
+            except Exception as e:
+                self.logger.warning(f"Failed to record station snapshot: {e!r}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            # Check again when the snapshot expires, in case a new one is available
+            await asyncio.sleep(max(snapshot.ttl - snapshot.age, 1))
@@ -0,0 +1,159 @@
+"""Prometheus metrics for the client and the REST API.
+
+Metrics are disabled until `enable()` is called, which requires `prometheus_client` (`bysykkel[metrics]`).
+Instrumented code checks `metrics.enabled` before recording anything,
+so disabled metrics only cost an attribute lookup per instrumented call.
+
+Example:
+    >>> from bysykkel import metrics
+    >>> metrics.enable()
+    >>> content, content_type = metrics.render()
+
+References:
+    Prometheus Python client: https://github.com/prometheus/client_python
+"""
+
+from typing import Any, Optional, Tuple
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover
+    prometheus_client = None  # type: ignore
+
+enabled = False
+
+# From 1 ms to 10 s
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# From 256 B to 4 MiB
+SIZE_BUCKETS = tuple(4**n for n in range(4, 12))
+
+# Set by `enable()`
+UPSTREAM_FETCH_SECONDS: Any = None
+UPSTREAM_FETCHES: Any = None
+UPSTREAM_RESPONSE_BYTES: Any = None
+PARSE_SECONDS: Any = None
+MERGE_SECONDS: Any = None
+SNAPSHOT_CACHE_REQUESTS: Any = None
+SNAPSHOT_AGE_SECONDS: Any = None
+RENDER_CACHE_REQUESTS: Any = None
+REQUEST_STAGE_SECONDS: Any = None
+RESPONSE_BYTES: Any = None
+
+_registry: Any = None
+
+
+def enable(registry: Optional[Any] = None) -> None:
+    """Create the metrics in `registry` (by default the global registry), and start recording them."""
+    global enabled, _registry
+    global UPSTREAM_FETCH_SECONDS, UPSTREAM_FETCHES, UPSTREAM_RESPONSE_BYTES
+    global PARSE_SECONDS, MERGE_SECONDS, SNAPSHOT_CACHE_REQUESTS, SNAPSHOT_AGE_SECONDS
+    global RENDER_CACHE_REQUESTS, REQUEST_STAGE_SECONDS, RESPONSE_BYTES
+    if enabled:
+        return
+    if UPSTREAM_FETCHES is not None and registry in (None, _registry):
+        # Already created, and only disabled
+        enabled = True
+        return
+    if prometheus_client is None:
+        raise ImportError(
+            "Metrics require prometheus_client: Install bysykkel[metrics]"
+        )
+
+    from prometheus_client import Counter, Gauge, Histogram
+
+    _registry = registry or prometheus_client.REGISTRY
+    options = dict(registry=_registry)
+    UPSTREAM_FETCH_SECONDS = Histogram(
+        "bysykkel_upstream_fetch_seconds",
+        "Time to query a GBFS feed, including retries and parsing",
+        ["feed"],
+        buckets=LATENCY_BUCKETS,
+        **options,
+    )
+    UPSTREAM_FETCHES = Counter(
+        "bysykkel_upstream_fetches",
+        "GBFS feed queries, by result: updated, not_modified, unchanged or error",
+        ["feed", "result"],
+        **options,
+    )
+    UPSTREAM_RESPONSE_BYTES = Histogram(
+        "bysykkel_upstream_response_bytes",
+        "Size of GBFS feed response bodies",
+        ["feed"],
+        buckets=SIZE_BUCKETS,
+        **options,
+    )
+    PARSE_SECONDS = Histogram(
+        "bysykkel_parse_seconds",
+        "Time to decode and parse a GBFS feed response",
+        ["feed"],
+        buckets=LATENCY_BUCKETS,
+        **options,
+    )
+    MERGE_SECONDS = Histogram(
+        "bysykkel_merge_seconds",
+        "Time to merge the station status and info feeds",
+        buckets=LATENCY_BUCKETS,
+        **options,
+    )
+    SNAPSHOT_CACHE_REQUESTS = Counter(
+        "bysykkel_snapshot_cache_requests",
+        "Snapshot cache lookups, by result: hit, stale, miss or fallback",
+        ["result"],
+        **options,
+    )
+    SNAPSHOT_AGE_SECONDS = Gauge(
+        "bysykkel_snapshot_age_seconds",
+        "Seconds since the current station snapshot was fetched",
+        ["system"],
+        **options,
+    )
+    RENDER_CACHE_REQUESTS = Counter(
+        "bysykkel_render_cache_requests",
+        "Rendered station list lookups, by result: hit or miss",
+        ["result"],
+        **options,
+    )
+    REQUEST_STAGE_SECONDS = Histogram(
+        "bysykkel_request_stage_seconds",
+        "Time spent in each stage of handling a request",
+        ["route", "stage"],
+        buckets=LATENCY_BUCKETS,
+        **options,
+    )
+    RESPONSE_BYTES = Histogram(
+        "bysykkel_response_bytes",
+        "Size of response bodies, before compression",
+        ["route"],
+        buckets=SIZE_BUCKETS,
+        **options,
+    )
+    enabled = True
+
+
+def disable() -> None:
+    """Stop recording metrics. They keep their values if enabled again without another registry."""
+    global enabled
+    enabled = False
+
+
+def render() -> Tuple[bytes, str]:
+    """Encode the metrics in the Prometheus text format. Returns the content and its content type."""
+    return (
+        prometheus_client.generate_latest(_registry),
+        prometheus_client.CONTENT_TYPE_LATEST,
+    )
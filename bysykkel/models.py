@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, KeysView, List, Optional
 
 from pydantic import BaseModel, BaseConfig
 
@@ -33,6 +33,7 @@ class StationInfoResponse(BaseModel):
     """
 
     last_updated: datetime
+    ttl: Optional[int]
     data: StationInfos
 
 
@@ -66,6 +67,7 @@ class StationStatusReponse(BaseModel):
     """
 
     last_updated: datetime
+    ttl: Optional[int]
     data: StationStatuses
 
 
@@ -75,6 +77,58 @@ class StationData(StationInfo, StationStatus):
     pass
 
 
+class NearbyStationData(StationData):
+    """Metadata and current status of an Oslo Bysykkel bike station, and its distance in meters from a location."""
+
+    distance: float
+
+
+class StationCollection:
+    """Collection of station data, indexed by `station_id`.
+
+    Iterating over the collection yields `StationData` objects,
+    while lookups and membership tests are by `station_id`:
+
+    Example:
+        >>> station = stations["627"]
+        >>> "627" in stations
+        >>> [station.name for station in stations]
+    """
+
+    def __init__(self, stations: Iterable[StationData] = ()) -> None:
+        self._by_id: Dict[str, StationData] = {
+            station.station_id: station for station in stations
+        }
+        self._rows: List[StationData] = list(self._by_id.values())
+
+    def __getitem__(self, station_id: str) -> StationData:
+        return self._by_id[station_id]
+
+    def __contains__(self, station_id: object) -> bool:
+        return station_id in self._by_id
+
+    def __iter__(self) -> Iterator[StationData]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self)} stations)"
+
+    def get(
+        self, station_id: str, default: Optional[StationData] = None
+    ) -> Optional[StationData]:
+        return self._by_id.get(station_id, default)
+
+    def ids(self) -> KeysView[str]:
+        return self._by_id.keys()
+
+    def rows(self, rows: Iterable[int]) -> Iterator[StationData]:
+        """Lazily get the stations at the given positions in the collection's iteration order."""
+        return map(self._rows.__getitem__, rows)
+
+
 class PartialStationData(StationData):
     """Subset of metadata and status fields of an Oslo Bysykkel bike station."""
 
@@ -92,3 +146,31 @@ class PartialStationData(StationData):
     lat: Optional[float]
     lon: Optional[float]
     capacity: Optional[int]
+
+
+class StationStatusSample(BaseModel):
+    """Status of an Oslo Bysykkel bike station at a point in time, from the station history."""
+
+    time: datetime
+    is_installed: int
+    is_renting: int
+    is_returning: int
+    num_bikes_available: int
+    num_docks_available: int
+
+
+class StationRollup(BaseModel):
+    """Availability of an Oslo Bysykkel bike station during an hour of the week, aggregated over the station history.
+
+    `weekday` is numbered from Monday (0) to Sunday (6).
+    `mean_bikes` is weighted by how long the station had each number of bikes available.
+    """
+
+    weekday: int
+    hour: int
+    observed_minutes: float
+    empty_minutes: float
+    full_minutes: float
+    min_bikes: int
+    mean_bikes: float
+    max_bikes: int
@@ -0,0 +1,100 @@
+"""Fast parsing of GBFS station feeds.
+
+Parsing the feeds with pydantic validates and copies every field of every station.
+These parsers instead build the models directly with `BaseModel.construct()`,
+only coercing each field to its annotated type. Payloads which don't fit the expected
+structure are parsed with pydantic instead, so invalid payloads still raise a `ValidationError`.
+
+If `orjson` is installed (`bysykkel[fast]`), it's used for decoding the response body.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+from pydantic import parse_obj_as
+from pydantic.datetime_parse import parse_datetime
+
+from bysykkel.models import (
+    StationInfo,
+    StationInfoResponse,
+    StationInfos,
+    StationStatus,
+    StationStatuses,
+    StationStatusReponse,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def loads(content: bytes) -> Any:
+    """Decode a JSON response body."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _str(value: Any) -> str:
+    # `str()` would turn a missing value into "None", instead of failing like the other coercions
+    if value is None:
+        raise TypeError("Required field is null")
+    return str(value)
+
+
+def _optional_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _optional_int(value: Any) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def _station_info(entry: Dict[str, Any]) -> StationInfo:
+    return StationInfo.construct(
+        station_id=_str(entry["station_id"]),
+        name=_str(entry["name"]),
+        address=_optional_str(entry.get("address")),
+        lat=float(entry["lat"]),
+        lon=float(entry["lon"]),
+        capacity=int(entry["capacity"]),
+    )
+
+
+def _station_status(entry: Dict[str, Any]) -> StationStatus:
+    return StationStatus.construct(
+        station_id=_str(entry["station_id"]),
+        is_installed=int(entry["is_installed"]),
+        is_renting=int(entry["is_renting"]),
+        is_returning=int(entry["is_returning"]),
+        num_bikes_available=int(entry["num_bikes_available"]),
+        num_docks_available=int(entry["num_docks_available"]),
+        last_reported=parse_datetime(entry["last_reported"]),
+    )
+
+
+def parse_station_information(body: Any) -> StationInfoResponse:
+    """Parse a `station_information.json` payload."""
+    try:
+        stations = [_station_info(entry) for entry in body["data"]["stations"]]
+        return StationInfoResponse.construct(
+            last_updated=parse_datetime(body["last_updated"]),
+            ttl=_optional_int(body.get("ttl")),
+            data=StationInfos.construct(stations=stations),
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return parse_obj_as(StationInfoResponse, body)
+
+
+def parse_station_status(body: Any) -> StationStatusReponse:
+    """Parse a `station_status.json` payload."""
+    try:
+        stations = [_station_status(entry) for entry in body["data"]["stations"]]
+        return StationStatusReponse.construct(
+            last_updated=parse_datetime(body["last_updated"]),
+            ttl=_optional_int(body.get("ttl")),
+            data=StationStatuses.construct(stations=stations),
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return parse_obj_as(StationStatusReponse, body)
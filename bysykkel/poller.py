@@ -0,0 +1,98 @@
+import asyncio
+from logging import getLogger
+from time import monotonic
+from typing import Callable, Optional
+
+from bysykkel.cache import (
+    SnapshotUnavailableError,
+    StationSnapshot,
+    build_snapshot,
+)
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationInfoResponse
+
+
+class StationPoller:
+    """Background task which keeps a merged station snapshot up to date.
+
+    The station status is polled according to the feed's `ttl`, while the station info
+    (metadata), which rarely changes, is only polled every `info_interval` seconds.
+    Each poll swaps in a new snapshot, so readers never see a partially updated one.
+    If given, `on_snapshot` is called with the snapshot after every poll, e.g. to publish it to other processes.
+    """
+
+    def __init__(
+        self,
+        client: BysykkelClient,
+        default_ttl: int = 10,
+        info_interval: int = 300,
+        on_snapshot: Optional[Callable[[StationSnapshot], None]] = None,
+    ) -> None:
+        self.client = client
+        self.default_ttl = default_ttl
+        self.info_interval = info_interval
+        self.on_snapshot = on_snapshot
+        self.logger = getLogger(type(self).__name__)
+        self._snapshot: Optional[StationSnapshot] = None
+        self._info: Optional[StationInfoResponse] = None
+        self._info_fetched_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> Optional[StationSnapshot]:
+        """The most recently polled snapshot, if any."""
+        return self._snapshot
+
+    @property
+    def is_ready(self) -> bool:
+        return self._snapshot is not None
+
+    async def get(self) -> StationSnapshot:
+        """Get the current snapshot. Raises `SnapshotUnavailableError` if none has been loaded yet."""
+        if self._snapshot is None:
+            raise SnapshotUnavailableError("No station snapshot has been loaded yet")
+        return self._snapshot
+
+    async def poll(self) -> StationSnapshot:
+        """Poll upstream once, and swap in the resulting snapshot."""
+        info_is_fresh = (
+            self._info is not None
+            and monotonic() - self._info_fetched_at < self.info_interval
+        )
+        # Both feeds are queried concurrently when the info needs refreshing.
+        status, info = await self.client.get_station_feeds(
+            self._info if info_is_fresh else None
+        )
+        if not info_is_fresh:
+            self._info, self._info_fetched_at = info, monotonic()
+
+        self._snapshot = build_snapshot(
+            self.client, status, info, self.default_ttl, previous=self._snapshot
+        )
+        if self.on_snapshot is not None:
+            self.on_snapshot(self._snapshot)
+        return self._snapshot
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = (await self.poll()).ttl
+            except Exception as e:
+                # Keep serving the previous snapshot, and try again later.
+                self.logger.warning(f"Failed to poll station feeds: {e!r}")
+                delay = self.default_ttl
+            await asyncio.sleep(max(delay, 1))
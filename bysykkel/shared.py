@@ -0,0 +1,143 @@
+"""Sharing station snapshots between processes through a file.
+
+A single process polls upstream and publishes each snapshot with a `SnapshotWriter`,
+while any number of worker processes load it with a `SharedSnapshotReader`,
+so adding workers doesn't add upstream queries.
+
+The file has three lines: A header with the wall-clock time the snapshot was fetched,
+followed by the station status and station info feeds as JSON.
+It's replaced atomically on every publish, so readers never see a partially written snapshot.
+Readers only parse the feeds which changed, and reuse the rest of the previous snapshot like `build_snapshot()` does.
+Placing the file on a tmpfs, e.g. `/dev/shm`, keeps it in shared memory.
+"""
+
+import json
+import os
+import tempfile
+import time
+from dataclasses import replace
+from logging import getLogger
+from time import monotonic
+from typing import Optional, Tuple
+
+from bysykkel.cache import SnapshotUnavailableError, StationSnapshot, build_snapshot
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationInfoResponse, StationStatusReponse
+from bysykkel.parsing import loads, parse_station_information, parse_station_status
+
+
+class SnapshotWriter:
+    """Publishes station snapshots to a file, e.g. as the `on_snapshot` callback of a `StationPoller`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.logger = getLogger(type(self).__name__)
+
+    def write(self, snapshot: StationSnapshot) -> None:
+        if snapshot.status is None or snapshot.info is None:
+            raise ValueError("Only snapshots with both feeds can be published")
+
+        # `fetched_at` is monotonic, which isn't comparable across processes
+        fetched_at = time.time() - snapshot.age
+        content = b"\n".join(
+            (
+                json.dumps({"fetched_at": fetched_at}).encode(),
+                snapshot.status.json().encode(),
+                snapshot.info.json().encode(),
+            )
+        )
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.logger.debug(f"Published snapshot to {self.path}")
+
+
+class SharedSnapshotReader:
+    """Station snapshot source which loads the snapshots published by a `SnapshotWriter` in another process.
+
+    The file is checked for changes at most every `check_interval` seconds,
+    so serving requests normally doesn't touch the file system.
+    """
+
+    def __init__(
+        self,
+        client: BysykkelClient,
+        path: str,
+        default_ttl: int = 10,
+        check_interval: float = 0.5,
+    ) -> None:
+        """
+        Args:
+            client: Client used for merging the feeds. It doesn't query upstream.
+            path: Path of the file written by the `SnapshotWriter`.
+            default_ttl: TTL to use if neither feed has a `ttl`.
+            check_interval: Min seconds between checking if the file changed.
+        """
+        self.client = client
+        self.path = path
+        self.default_ttl = default_ttl
+        self.check_interval = check_interval
+        self.logger = getLogger(type(self).__name__)
+        self._snapshot: Optional[StationSnapshot] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._checked_at = float("-inf")
+        self._lines: Tuple[bytes, bytes] = (b"", b"")
+
+    @property
+    def snapshot(self) -> Optional[StationSnapshot]:
+        """The most recently loaded snapshot, if any."""
+        return self._snapshot
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether a snapshot has been published, loading it if it has."""
+        return self.load() is not None
+
+    async def get(self) -> StationSnapshot:
+        """Get the latest published snapshot. Raises `SnapshotUnavailableError` if none has been published yet."""
+        if monotonic() - self._checked_at >= self.check_interval:
+            self._checked_at = monotonic()
+            self.load()
+        if self._snapshot is None:
+            raise SnapshotUnavailableError(f"No station snapshot in {self.path} yet")
+        return self._snapshot
+
+    def load(self) -> Optional[StationSnapshot]:
+        """Load the published snapshot, if the file changed since it was last loaded."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._snapshot
+        # The file is replaced on every publish, so it gets a new inode
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return self._snapshot
+
+        with open(self.path, "rb") as f:
+            header, status_line, info_line = f.read().split(b"\n")
+        previous = self._snapshot
+        # Unchanged feeds are reused, so the snapshot's merged stations and indexes can be reused too
+        status: StationStatusReponse = (
+            previous.status  # type: ignore
+            if previous is not None and status_line == self._lines[0]
+            else parse_station_status(loads(status_line))
+        )
+        info: StationInfoResponse = (
+            previous.info  # type: ignore
+            if previous is not None and info_line == self._lines[1]
+            else parse_station_information(loads(info_line))
+        )
+        age = time.time() - loads(header)["fetched_at"]
+        snapshot = build_snapshot(
+            self.client, status, info, self.default_ttl, previous=previous
+        )
+        self._snapshot = replace(snapshot, fetched_at=monotonic() - age)
+        self._signature = signature
+        self._lines = (status_line, info_line)
+        return self._snapshot
@@ -0,0 +1,163 @@
+"""Spatial index of station locations, for nearest-station and bounding box queries."""
+
+import heapq
+import math
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+EARTH_RADIUS = 6_371_000  # Meters
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+Cell = Tuple[int, int]
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in meters between two coordinates, using the haversine formula."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+class GridIndex:
+    """Uniform grid over station coordinates.
+
+    Each station is placed in a grid cell of `cell_size` by `cell_size` degrees,
+    so queries only need to look at the stations in the cells close to the query.
+    The index only depends on the station locations, so it can be reused until `station_information.json` changes.
+    """
+
+    def __init__(
+        self, stations: Iterable[Tuple[str, float, float]], cell_size: float = 0.005
+    ) -> None:
+        """
+        Args:
+            stations: `(station_id, lat, lon)` tuples.
+            cell_size: Width and height of the grid cells, in degrees.
+        """
+        self.cell_size = cell_size
+        self.locations: Dict[str, Tuple[float, float]] = {}
+        self.cells: Dict[Cell, List[str]] = defaultdict(list)
+        for station_id, lat, lon in stations:
+            self.locations[station_id] = (lat, lon)
+            self.cells[self.cell(lat, lon)].append(station_id)
+
+        if self.cells:
+            self._min_cell = tuple(map(min, zip(*self.cells)))
+            self._max_cell = tuple(map(max, zip(*self.cells)))
+            self._max_abs_lat = max(abs(lat) for lat, _ in self.locations.values())
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def cell(self, lat: float, lon: float) -> Cell:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def within(
+        self, min_lat: float, min_lon: float, max_lat: float, max_lon: float
+    ) -> List[str]:
+        """Get the ids of the stations within a bounding box."""
+        min_row, min_col = self.cell(min_lat, min_lon)
+        max_row, max_col = self.cell(max_lat, max_lon)
+        if self.cells:
+            # Don't iterate over empty cells outside the grid, e.g. for huge bounding boxes.
+            min_row = max(min_row, self._min_cell[0])
+            min_col = max(min_col, self._min_cell[1])
+            max_row = min(max_row, self._max_cell[0])
+            max_col = min(max_col, self._max_cell[1])
+
+        station_ids = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                for station_id in self.cells.get((row, col), ()):
+                    lat, lon = self.locations[station_id]
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                        station_ids.append(station_id)
+        return station_ids
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 1,
+        accept: Optional[Callable[[str], bool]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Get the `k` nearest stations, as `(station_id, distance in meters)` ordered by distance.
+
+        If given, only stations for which `accept(station_id)` is true are considered.
+        The cells are searched in rings of increasing size around the query location,
+        stopping as soon as no unsearched cell can contain a closer station.
+        Rings are clipped to the grid, and the search starts at the first ring which reaches it,
+        so queries far away from the stations don't search empty cells.
+        """
+        if k <= 0 or not self.cells:
+            return []
+
+        center_row, center_col = self.cell(lat, lon)
+        # Smallest width of a cell in meters, as cells are narrower further from the equator.
+        # Stations `ring` cells away from the center cell are at least `(ring - 1) * cell_meters` away.
+        max_abs_lat = max(abs(lat), self._max_abs_lat) + self.cell_size
+        cell_meters = (
+            self.cell_size
+            * METERS_PER_DEGREE
+            * max(math.cos(math.radians(min(max_abs_lat, 90))), 0.0)
+        )
+        (min_row, min_col), (max_row, max_col) = self._min_cell, self._max_cell
+        min_ring = max(
+            min_row - center_row,
+            center_row - max_row,
+            min_col - center_col,
+            center_col - max_col,
+            0,
+        )
+        max_ring = max(
+            abs(center_row - min_row),
+            abs(center_row - max_row),
+            abs(center_col - min_col),
+            abs(center_col - max_col),
+        )
+
+        # Max-heap of the k nearest stations found so far, as (-distance, station_id)
+        nearest: List[Tuple[float, str]] = []
+        for ring in range(min_ring, max_ring + 1):
+            if len(nearest) == k and (ring - 1) * cell_meters > -nearest[0][0]:
+                break
+            for cell in self._ring(center_row, center_col, ring):
+                for station_id in self.cells.get(cell, ()):
+                    if accept is not None and not accept(station_id):
+                        continue
+                    station_distance = distance(lat, lon, *self.locations[station_id])
+                    if len(nearest) < k:
+                        heapq.heappush(nearest, (-station_distance, station_id))
+                    elif station_distance < -nearest[0][0]:
+                        heapq.heapreplace(nearest, (-station_distance, station_id))
+
+        return [
+            (station_id, -negative_distance)
+            for negative_distance, station_id in sorted(nearest, reverse=True)
+        ]
+
+    def _ring(self, center_row: int, center_col: int, ring: int) -> Iterable[Cell]:
+        """Cells of the grid exactly `ring` cells away from the center cell, in either direction."""
+        if ring == 0:
+            yield center_row, center_col
+            return
+        (min_row, min_col), (max_row, max_col) = self._min_cell, self._max_cell
+        cols = range(
+            max(center_col - ring, min_col), min(center_col + ring, max_col) + 1
+        )
+        for row in (center_row - ring, center_row + ring):
+            if min_row <= row <= max_row:
+                for col in cols:
+                    yield row, col
+        rows = range(
+            max(center_row - ring + 1, min_row), min(center_row + ring - 1, max_row) + 1
+        )
+        for col in (center_col - ring, center_col + ring):
+            if min_col <= col <= max_col:
+                for row in rows:
+                    yield row, col
@@ -0,0 +1,120 @@
+import httpx
+import pytest
+import respx
+from pydantic import parse_obj_as
+
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationInfoResponse, StationStatusReponse
+
+
+@pytest.fixture
+def system_information_response():
+    """Example response from https://oslobysykkel.no/en/open-data/realtime"""
+    url = "https://gbfs.urbansharing.com/oslobysykkel.no/station_information.json"
+    body = {
+        "last_updated": 1553592653,
+        "data": {
+            "stations": [
+                {
+                    "station_id": "627",
+                    "name": "Skøyen Stasjon",
+                    "address": "Skøyen Stasjon",
+                    "lat": 59.9226729,
+                    "lon": 10.6788129,
+                    "capacity": 20,
+                },
+                {
+                    "station_id": "623",
+                    "name": "7 Juni Plassen",
+                    "address": "7 Juni Plassen",
+                    "lat": 59.9150596,
+                    "lon": 10.7312715,
+                    "capacity": 15,
+                },
+                {
+                    "station_id": "610",
+                    "name": "Sotahjørnet",
+                    "address": "Sotahjørnet",
+                    "lat": 59.9099822,
+                    "lon": 10.7914482,
+                    "capacity": 20,
+                },
+            ]
+        },
+    }
+
+    return {"url": url, "body": body}
+
+
+@pytest.fixture
+def system_status_response():
+    """Example response based on https://oslobysykkel.no/en/open-data/realtime
+
+    NOTE: `station_id` fields have been updated from the example response,
+           so there's overlap with the `station_id`s in the `system_information_response` fixture
+    """
+    url = "https://gbfs.urbansharing.com/oslobysykkel.no/station_status.json"
+    body = {
+        "last_updated": 1540219230,
+        "data": {
+            "stations": [
+                {
+                    "is_installed": 1,
+                    "is_renting": 1,
+                    "num_bikes_available": 7,
+                    "num_docks_available": 5,
+                    "last_reported": 1540219230,
+                    "is_returning": 1,
+                    "station_id": "627",
+                },
+                {
+                    "is_installed": 1,
+                    "is_renting": 1,
+                    "num_bikes_available": 4,
+                    "num_docks_available": 8,
+                    "last_reported": 1540219230,
+                    "is_returning": 1,
+                    "station_id": "623",
+                },
+                {
+                    "is_installed": 1,
+                    "is_renting": 1,
+                    "num_bikes_available": 4,
+                    "num_docks_available": 9,
+                    "last_reported": 1540219230,
+                    "is_returning": 1,
+                    "station_id": "10",
+                },
+            ]
+        },
+    }
+
+    return {"url": url, "body": body}
+
+
+@pytest.fixture
+def station_feeds(system_status_response, system_information_response):
+    """The example responses, parsed as `(status, info)`."""
+    status = parse_obj_as(StationStatusReponse, system_status_response["body"])
+    info = parse_obj_as(StationInfoResponse, system_information_response["body"])
+    return status, info
+
+
+@pytest.fixture
+def stations(station_feeds):
+    """The stations of the example responses, merged."""
+    return BysykkelClient("http://localhost").merge_stations(*station_feeds)
+
+
+@pytest.fixture
+def station_routes(system_status_response, system_information_response):
+    status_body = {**system_status_response["body"], "ttl": 10}
+    info_body = {**system_information_response["body"], "ttl": 10}
+    with respx.mock:
+        status_route = respx.get(system_status_response["url"]).mock(
+            return_value=httpx.Response(200, json=status_body)
+        )
+        info_route = respx.get(system_information_response["url"]).mock(
+            return_value=httpx.Response(200, json=info_body)
+        )
+        yield status_route, info_route
@@ -95,6 +95,15 @@ def test_stations_route_filtering_invalid_query_results_in_400_response(
     assert response.status_code == 400
 
 
+def test_stations_route_supports_looking_up_ids(client: TestClient):
+    stations = client.get("/v1/stations?fields=station_id&limit=3").json()
+    ids = [station["station_id"] for station in reversed(stations)]
+    response = client.get(f"/v1/stations?ids={','.join(ids)},unknown&fields=station_id")
+
+    assert response.status_code == 200
+    assert ids == [station["station_id"] for station in response.json()]
+
+
 def test_stations_route_supports_limit_count_returned(
     client: TestClient,
 ):
@@ -105,3 +114,14 @@ def test_stations_route_supports_limit_count_returned(
     body = response.json()
     assert isinstance(body, list)
     assert len(body) <= limit
+
+
+def test_stations_route_supports_sorting(client: TestClient):
+    response = client.get(
+        "/v1/stations?sort=-num_bikes_available&limit=10&fields=station_id,num_bikes_available"
+    )
+
+    assert response.status_code == 200
+    bikes = [station["num_bikes_available"] for station in response.json()]
+    assert sorted(bikes, reverse=True) == bikes
+    assert client.get("/v1/stations?sort=unknown").status_code == 400
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+from bysykkel.cache import SnapshotCache, StationSnapshot
+from bysykkel.client import BysykkelClient
+
+
+@pytest.mark.asyncio
+async def test_snapshotcache_serves_fresh_snapshot_from_cache(station_routes):
+    status_route, info_route = station_routes
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+
+    first = await cache.get()
+    second = await cache.get()
+
+    assert first is second
+    assert 2 == len(first.stations)
+    assert 10 == first.ttl
+    assert 1 == status_route.call_count
+    assert 1 == info_route.call_count
+
+
+@pytest.mark.asyncio
+async def test_snapshotcache_coalesces_concurrent_misses(station_routes):
+    status_route, info_route = station_routes
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+
+    snapshots = await asyncio.gather(*(cache.get() for _ in range(10)))
+
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert 1 == status_route.call_count
+
+
+@pytest.mark.asyncio
+async def test_snapshotcache_serves_stale_snapshot_while_revalidating(station_routes):
+    status_route, info_route = station_routes
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+    stale = await cache.get()
+    cache._snapshot = StationSnapshot(
+        stale.stations, stale.last_updated, stale.ttl, fetched_at=stale.fetched_at - 60
+    )
+
+    served = await cache.get()
+    assert served.stations is stale.stations
+    assert not served.is_fresh
+
+    await cache.refresh()
+    assert cache.snapshot.is_fresh
+    assert 2 == status_route.call_count
+
+
+@pytest.mark.asyncio
+async def test_snapshotcache_reuses_stations_if_feeds_are_unchanged(station_routes):
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+
+    first = await cache.refresh()
+    second = await cache.refresh()
+
+    assert first is not second
+    assert first.stations is second.stations
+
+
+@pytest.mark.asyncio
+async def test_snapshotcache_serves_last_good_snapshot_when_upstream_fails(
+    station_routes,
+):
+    status_route, info_route = station_routes
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no", retries=0),
+        max_stale=0,
+    )
+    good = await cache.get()
+    cache._snapshot = StationSnapshot(
+        good.stations, good.last_updated, good.ttl, fetched_at=good.fetched_at - 60
+    )
+    status_route.return_value = httpx.Response(502)
+
+    served = await cache.get()
+
+    assert served.stations is good.stations
+    assert 60 <= served.age
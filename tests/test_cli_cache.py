@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from bysykkel.cli.cache import SnapshotFileCache
+from bysykkel.cli.main import app, select_stations
+
+BASE_URL = "http://localhost"
+
+STATIONS = [
+    {"station_id": "1", "name": "A", "address": None, "num_bikes_available": 3, "num_docks_available": 7},
+    {"station_id": "2", "name": "B", "address": "Gate 2", "num_bikes_available": 9, "num_docks_available": 1},
+    {"station_id": "3", "name": "C", "address": "Gate 3", "num_bikes_available": 5, "num_docks_available": 5},
+]  # fmt: skip
+
+
+def test_snapshot_file_cache_stores_snapshots(tmp_path):
+    cache = SnapshotFileCache(tmp_path, BASE_URL)
+    assert cache.load() is None
+
+    cache.store(STATIONS, ttl=10)
+    snapshot = cache.load()
+
+    assert STATIONS == snapshot.stations
+    assert 10 == snapshot.ttl
+    assert 0 <= snapshot.age < 10
+    assert SnapshotFileCache(tmp_path, "http://elsewhere").load() is None
+
+
+def test_select_stations_filters_sorts_and_limits():
+    assert ["2", "3"] == [
+        station["station_id"]
+        for station in select_stations(
+            STATIONS, min_bikes=4, sort="-num_bikes_available"
+        )
+    ]
+    assert ["3"] == [
+        station["station_id"] for station in select_stations(STATIONS, search="gate 3")
+    ]
+    assert ["1", "3"] == [
+        station["station_id"]
+        for station in select_stations(STATIONS, sort="num_bikes_available", limit=2)
+    ]
+    # Stations without the sort field are sorted last
+    assert ["3", "2", "1"] == [
+        station["station_id"] for station in select_stations(STATIONS, sort="-address")
+    ]
+
+
+def test_list_command_uses_cached_stations_offline(tmp_path):
+    SnapshotFileCache(tmp_path, BASE_URL).store(STATIONS, ttl=10, fetched_at=0)
+
+    result = CliRunner().invoke(
+        app,
+        [
+            f"--base-url={BASE_URL}",
+            f"--cache-dir={tmp_path}",
+            "list",
+            "--offline",
+            "--format=json",
+            "--fields=station_id,num_docks_available",
+            "--sort=-num_docks_available",
+            "--limit=1",
+        ],
+    )
+
+    assert 0 == result.exit_code, result.output
+    assert [{"station_id": "1", "num_docks_available": 7}] == json.loads(result.output)
+
+
+def test_snapshot_file_cache_stores_utf8_and_cleans_up_failed_writes(tmp_path):
+    cache = SnapshotFileCache(tmp_path, BASE_URL)
+
+    cache.store([{**STATIONS[0], "name": "Ålesund"}], ttl=10)
+    assert "Ålesund" in cache.path.read_bytes().decode("utf-8")
+
+    with pytest.raises(TypeError):
+        cache.store([{**STATIONS[0], "name": object()}], ttl=10)
+    assert [cache.path] == list(tmp_path.iterdir())
+    assert "Ålesund" == cache.load().stations[0]["name"]
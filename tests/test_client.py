@@ -1,97 +1,24 @@
-from typing import List
+import asyncio
 
 import httpx
 import pytest
 import respx
 
 
-from bysykkel.client import BysykkelClient
-from bysykkel.models import StationData, StationInfoResponse, StationStatusReponse
-
-
-@pytest.fixture
-def system_information_response():
-    """Example response from https://oslobysykkel.no/en/open-data/realtime"""
-    url = "https://gbfs.urbansharing.com/oslobysykkel.no/station_information.json"
-    body = {
-        "last_updated": 1553592653,
-        "data": {
-            "stations": [
-                {
-                    "station_id": "627",
-                    "name": "Skøyen Stasjon",
-                    "address": "Skøyen Stasjon",
-                    "lat": 59.9226729,
-                    "lon": 10.6788129,
-                    "capacity": 20,
-                },
-                {
-                    "station_id": "623",
-                    "name": "7 Juni Plassen",
-                    "address": "7 Juni Plassen",
-                    "lat": 59.9150596,
-                    "lon": 10.7312715,
-                    "capacity": 15,
-                },
-                {
-                    "station_id": "610",
-                    "name": "Sotahjørnet",
-                    "address": "Sotahjørnet",
-                    "lat": 59.9099822,
-                    "lon": 10.7914482,
-                    "capacity": 20,
-                },
-            ]
-        },
-    }
-
-    return {"url": url, "body": body}
-
-
-@pytest.fixture
-def system_status_response():
-    """Example response based on https://oslobysykkel.no/en/open-data/realtime
-
-    NOTE: `station_id` fields have been updated from the example response,
-           so there's overlap with the `station_id`s in the `system_information_response` fixture
-    """
-    url = "https://gbfs.urbansharing.com/oslobysykkel.no/station_status.json"
-    body = {
-        "last_updated": 1540219230,
-        "data": {
-            "stations": [
-                {
-                    "is_installed": 1,
-                    "is_renting": 1,
-                    "num_bikes_available": 7,
-                    "num_docks_available": 5,
-                    "last_reported": 1540219230,
-                    "is_returning": 1,
-                    "station_id": "627",
-                },
-                {
-                    "is_installed": 1,
-                    "is_renting": 1,
-                    "num_bikes_available": 4,
-                    "num_docks_available": 8,
-                    "last_reported": 1540219230,
-                    "is_returning": 1,
-                    "station_id": "623",
-                },
-                {
-                    "is_installed": 1,
-                    "is_renting": 1,
-                    "num_bikes_available": 4,
-                    "num_docks_available": 9,
-                    "last_reported": 1540219230,
-                    "is_returning": 1,
-                    "station_id": "10",
-                },
-            ]
-        },
-    }
-
-    return {"url": url, "body": body}
+from bysykkel.client import (
+    BysykkelClient,
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamError,
+    diff_stations,
+    station_id_key,
+)
+from bysykkel.models import (
+    StationCollection,
+    StationData,
+    StationInfoResponse,
+    StationStatusReponse,
+)
 
 
 def test_bysykkelclient_instantiates():
@@ -138,7 +65,386 @@ async def test_bysykkelclient_can_list_station_data(
 
     client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
 
-    stations: List[StationData] = await client.get_stations()
+    stations: StationCollection = await client.get_stations()
 
     # Two station ids overlap between the system_status_response and system_information_response fixtures
     assert 2 == len(stations)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_station_data_can_be_looked_up_by_id(
+    system_status_response, system_information_response
+):
+    mock = respx.get(system_information_response["url"]).mock(
+        return_value=httpx.Response(200, json=system_information_response["body"])
+    )
+    mock = respx.get(system_status_response["url"]).mock(
+        return_value=httpx.Response(200, json=system_status_response["body"])
+    )
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    stations: StationCollection = await client.get_stations()
+
+    assert "627" in stations
+    assert "10" not in stations
+    assert "Skøyen Stasjon" == stations["627"].name
+    assert 7 == stations["627"].num_bikes_available
+    assert stations.get("10") is None
+    assert {"627", "623"} == set(stations.ids())
+    assert {"627", "623"} == {station.station_id for station in stations}
+
+
+@pytest.mark.asyncio
+async def test_bysykkelclient_reuses_session_until_closed():
+    async with BysykkelClient("http://localhost") as client:
+        session = client.session
+        assert session is client.session
+
+    assert session.is_closed
+    assert client.session is not session
+    await client.aclose()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_only_queries_status_given_station_information(
+    system_status_response, system_information_response
+):
+    info_mock = respx.get(system_information_response["url"]).mock(
+        return_value=httpx.Response(200, json=system_information_response["body"])
+    )
+    status_mock = respx.get(system_status_response["url"]).mock(
+        return_value=httpx.Response(200, json=system_status_response["body"])
+    )
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    info = await client.get_station_information()
+    stations: StationCollection = await client.get_stations(info=info)
+
+    assert 2 == len(stations)
+    assert 1 == info_mock.call_count
+    assert 1 == status_mock.call_count
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_station_data_query_fails_if_either_feed_fails(
+    system_status_response, system_information_response
+):
+    mock = respx.get(system_information_response["url"]).mock(
+        side_effect=httpx.ConnectError("Connection refused")
+    )
+    mock = respx.get(system_status_response["url"]).mock(
+        return_value=httpx.Response(200, json=system_status_response["body"])
+    )
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    with pytest.raises(UpstreamError) as error:
+        await client.get_stations()
+    assert isinstance(error.value.__cause__, httpx.ConnectError)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_station_data_query_waits_for_cancelled_query(
+    system_status_response, system_information_response
+):
+    async def slow_failure(request):
+        await asyncio.sleep(0.1)
+        return httpx.Response(404)
+
+    respx.get(system_status_response["url"]).mock(return_value=httpx.Response(404))
+    respx.get(system_information_response["url"]).mock(side_effect=slow_failure)
+    tasks = set(asyncio.all_tasks())
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    with pytest.raises(UpstreamError):
+        await client.get_stations()
+    # The cancelled query is done too
+    assert tasks == set(asyncio.all_tasks())
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_sends_conditional_requests(system_status_response):
+    url, body = system_status_response["url"], system_status_response["body"]
+
+    def respond(request: httpx.Request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=body, headers={"ETag": '"v1"'})
+
+    mock = respx.get(url).mock(side_effect=respond)
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    first: StationStatusReponse = await client.get_station_status()
+    second: StationStatusReponse = await client.get_station_status()
+
+    assert 2 == mock.call_count
+    assert first is second
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_detects_unchanged_last_updated(system_status_response):
+    url, body = system_status_response["url"], system_status_response["body"]
+    updated_body = {**body, "last_updated": body["last_updated"] + 10}
+    mock = respx.get(url).mock(
+        side_effect=[
+            httpx.Response(200, json=body),
+            httpx.Response(200, json=body),
+            httpx.Response(200, json=updated_body),
+        ]
+    )
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    first: StationStatusReponse = await client.get_station_status()
+    second: StationStatusReponse = await client.get_station_status()
+    third: StationStatusReponse = await client.get_station_status()
+
+    assert first is second
+    assert third is not second
+
+
+def _station(station_id: str, **fields) -> StationData:
+    values = dict(
+        station_id=station_id,
+        name=f"Station {station_id}",
+        address=None,
+        lat=59.9,
+        lon=10.7,
+        capacity=20,
+        is_installed=1,
+        is_renting=1,
+        is_returning=1,
+        num_bikes_available=5,
+        num_docks_available=15,
+        last_reported=None,
+    )
+    return StationData.construct(**{**values, **fields})
+
+
+def test_diff_stations_finds_added_removed_and_changed_stations():
+    unchanged = _station("1")
+    old = StationCollection([unchanged, _station("2"), _station("3")])
+    new = StationCollection(
+        [unchanged, _station("2", num_bikes_available=6), _station("4")]
+    )
+
+    diff = diff_stations(old, new)
+
+    assert diff
+    assert ["4"] == [station.station_id for station in diff.added]
+    assert ["3"] == diff.removed
+    assert {"2": {"num_bikes_available": 6}} == diff.changed
+    assert new is diff.stations
+    assert not diff_stations(new, new)
+
+
+def test_diff_stations_only_compares_given_fields():
+    old = StationCollection([_station("1")])
+    new = StationCollection([_station("1", name="Renamed", num_bikes_available=6)])
+
+    assert {"1": {"num_bikes_available": 6}} == diff_stations(
+        old, new, fields=["num_bikes_available"]
+    ).changed
+    assert {"1": {"num_bikes_available": 6}} == diff_stations(
+        old, new, info_changed=False
+    ).changed
+
+
+def test_station_id_key_orders_numeric_ids_numerically():
+    assert ["2", "10", "627", "a", "b1"] == sorted(
+        ["b1", "627", "a", "10", "2"], key=station_id_key
+    )
+
+
+@pytest.mark.asyncio
+async def test_bysykkelclient_watch_yields_changes(
+    station_routes, system_status_response, monkeypatch
+):
+    status_route, _ = station_routes
+    body = system_status_response["body"]
+    stations = body["data"]["stations"]
+    updated_body = {
+        **body,
+        "last_updated": body["last_updated"] + 10,
+        "data": {
+            "stations": [{**stations[0], "num_bikes_available": 0}, *stations[1:]]
+        },
+    }
+    status_route.side_effect = [
+        httpx.Response(200, json=body),
+        httpx.Response(200, json=body),
+        httpx.Response(200, json=updated_body),
+    ]
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr("bysykkel.client.asyncio.sleep", no_sleep)
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    watch = client.watch()
+
+    first = await watch.__anext__()
+    assert {"627", "623"} == {station.station_id for station in first.added}
+    assert not first.changed
+
+    second = await watch.__anext__()
+    assert {"627": {"num_bikes_available": 0}} == second.changed
+    assert 3 == status_route.call_count
+    await watch.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bysykkelclient_watch_retries_failed_polls(
+    station_routes, system_status_response, monkeypatch
+):
+    status_route, _ = station_routes
+    status_route.side_effect = [
+        httpx.Response(404),
+        httpx.Response(200, json=system_status_response["body"]),
+    ]
+    sleeps = []
+
+    async def no_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr("bysykkel.client.asyncio.sleep", no_sleep)
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    watch = client.watch(default_ttl=5)
+
+    first = await watch.__anext__()
+    assert {"627", "623"} == {station.station_id for station in first.added}
+    assert [5] == sleeps
+    await watch.aclose()
+
+
+@pytest.mark.asyncio
+async def test_bysykkelclient_discovers_feed_urls(station_routes):
+    discovery = respx.get(
+        "https://gbfs.urbansharing.com/oslobysykkel.no/gbfs.json"
+    ).mock(
+        return_value=httpx.Response(
+            200,
+            json={
+                "last_updated": 1553592653,
+                "data": {
+                    "nb": {
+                        "feeds": [
+                            {
+                                "name": "station_status",
+                                "url": "https://gbfs.urbansharing.com/oslobysykkel.no/station_status.json",
+                            }
+                        ]
+                    }
+                },
+            },
+        )
+    )
+    client = BysykkelClient(
+        "https://gbfs.urbansharing.com/oslobysykkel.no", discovery=True
+    )
+
+    # Concurrent queries share a single discovery
+    stations = await client.get_stations()
+    await client.get_station_status()
+
+    assert 1 == discovery.call_count
+    assert {"station_status"} == set(client.feed_urls)
+    assert {"627", "623"} == set(stations.ids())
+
+
+@pytest.mark.asyncio
+async def test_bysykkelclient_does_not_close_given_session(station_routes):
+    session = httpx.AsyncClient()
+    async with BysykkelClient(
+        "https://gbfs.urbansharing.com/oslobysykkel.no", session=session
+    ) as client:
+        await client.get_station_status()
+
+    assert client.session is session
+    assert not session.is_closed
+    await session.aclose()
+
+    # A closed session given by the caller isn't replaced by one with other settings
+    with pytest.raises(RuntimeError):
+        client.session
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_retries_server_errors(system_status_response):
+    url, body = system_status_response["url"], system_status_response["body"]
+    mock = respx.get(url).mock(
+        side_effect=[
+            httpx.Response(503),
+            httpx.ReadTimeout("Timed out"),
+            httpx.Response(200, json=body),
+        ]
+    )
+
+    client = BysykkelClient(
+        "https://gbfs.urbansharing.com/oslobysykkel.no", retries=2, retry_backoff=0
+    )
+
+    status: StationStatusReponse = await client.get_station_status()
+    assert 3 == len(status.data.stations)
+    assert 3 == mock.call_count
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_raises_upstreamerror_on_malformed_feeds(
+    system_status_response,
+):
+    mock = respx.get(system_status_response["url"]).mock(
+        side_effect=[
+            httpx.Response(200, text="<html>Bad gateway</html>"),
+            httpx.Response(200, json={"data": {}}),
+            httpx.Response(404),
+        ]
+    )
+
+    client = BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+
+    for _ in range(3):
+        with pytest.raises(UpstreamError):
+            await client.get_station_status()
+    # Client errors aren't retried
+    assert 3 == mock.call_count
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_bysykkelclient_circuit_breaker_fails_fast_when_open(
+    system_status_response,
+):
+    url, body = system_status_response["url"], system_status_response["body"]
+    mock = respx.get(url).mock(return_value=httpx.Response(500))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    client = BysykkelClient(
+        "https://gbfs.urbansharing.com/oslobysykkel.no", retries=0, breaker=breaker
+    )
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            await client.get_station_status()
+    with pytest.raises(CircuitOpenError):
+        await client.get_station_status()
+    assert 2 == mock.call_count
+
+    # Half-open: The first query after the timeout closes the breaker if it succeeds
+    breaker.opened_at -= 30
+    mock.return_value = httpx.Response(200, json=body)
+    await client.get_station_status()
+    assert not breaker.is_open
+    assert 0 == breaker.failures
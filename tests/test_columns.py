@@ -0,0 +1,55 @@
+from bysykkel.columns import ColumnarStationCollection, StationColumns
+
+
+def test_stationcolumns_holds_a_column_per_field(stations):
+    columns = StationColumns.from_stations(stations)
+
+    assert 2 == len(columns)
+    assert "627" in columns
+    row = columns.index["627"]
+    assert 7 == columns["num_bikes_available"][row]
+    assert "Skøyen Stasjon" == columns["name"][row]
+
+
+def test_stationcolumns_looks_up_rows_by_station_id(stations):
+    columns = StationColumns.from_stations(stations)
+
+    rows = columns.rows(["623", "unknown", "627", "623"])
+
+    assert ["623", "627"] == [columns["station_id"][row] for row in rows]
+
+
+def test_stationcolumns_orders_rows_by_field(stations):
+    columns = StationColumns.from_stations(stations)
+    by_bikes = [columns.index["623"], columns.index["627"]]
+
+    assert by_bikes == list(columns.ordering("num_bikes_available"))
+    assert by_bikes[::-1] == list(columns.ordering("num_bikes_available", True))
+    assert columns.ordering("name") is columns.ordering("name")
+
+
+def test_stationcolumns_sorts_top_rows(stations):
+    columns = StationColumns.from_stations(stations)
+    rows = range(len(columns))
+
+    assert [columns.index["627"]] == columns.sort_rows(
+        rows, "num_bikes_available", descending=True, limit=1
+    )
+    assert list(columns.ordering("capacity")) == columns.sort_rows(rows, "capacity")
+
+
+def test_stationcolumns_orders_station_ids_like_the_default_order():
+    columns = StationColumns({"station_id": ["10", "2", "a", "1"]})
+
+    assert [3, 1, 0, 2] == list(columns.ordering("station_id"))
+    assert [2, 0, 1, 3] == list(columns.ordering("station_id", descending=True))
+    assert [3, 1] == columns.sort_rows(range(4), "station_id", limit=2)
+
+
+def test_columnarstationcollection_materialises_the_stations(stations):
+    collection = ColumnarStationCollection(StationColumns.from_stations(stations))
+
+    assert list(stations) == list(collection)
+    assert stations["623"] == collection["623"]
+    assert "627" in collection
+    assert collection.get("unknown") is None
@@ -0,0 +1,117 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from bysykkel.app.compression import (
+    ENCODINGS,
+    CompressionMiddleware,
+    brotli,
+    compress,
+    compressor,
+    negotiate,
+    zstandard,
+)
+
+BODY = b"station," * 200
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/body")
+    def body():
+        return Response(BODY, media_type="text/plain")
+
+    @app.get("/small")
+    def small():
+        return Response(b"small", media_type="text/plain")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY, BODY]), media_type="text/plain")
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([BODY]), media_type="text/event-stream")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        ("gzip", "gzip"),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("identity", None),
+        ("", None),
+        ("gzip;q=0.5, *", ENCODINGS[0]),
+    ],
+)
+def test_negotiate_picks_preferred_coding(accept_encoding, expected):
+    assert expected == negotiate(accept_encoding)
+
+
+def test_negotiate_breaks_ties_by_server_preference():
+    assert "gzip" == negotiate("gzip, br", ["gzip", "br"])
+    assert "br" == negotiate("gzip, br", ["br", "gzip"])
+    assert "gzip" == negotiate("gzip, br;q=0.9", ["br", "gzip"])
+
+
+@pytest.mark.parametrize("coding", ENCODINGS)
+def test_compressors_are_decompressible(coding):
+    incremental = compressor(coding)
+    streamed = incremental.compress(BODY) + incremental.compress(BODY)
+    streamed += incremental.flush()
+
+    if coding == "gzip":
+        assert BODY == gzip.decompress(compress(BODY, coding))
+        assert BODY * 2 == gzip.decompress(streamed)
+    else:
+        assert len(compress(BODY, coding)) < len(BODY)
+        assert len(streamed) < len(BODY)
+
+
+@pytest.mark.parametrize("coding", ENCODINGS)
+def test_compressors_sync_partial_bodies(coding):
+    incremental = compressor(coding)
+    partial = incremental.compress(BODY) + incremental.sync()
+
+    if coding == "zstd":
+        decompress = zstandard.ZstdDecompressor().decompressobj().decompress
+    elif coding == "br":
+        decompress = brotli.Decompressor().process
+    else:
+        decompress = zlib.decompressobj(31).decompress
+    assert BODY == decompress(partial)
+
+
+def test_middleware_compresses_responses(client):
+    response = client.get("/body", headers={"Accept-Encoding": "gzip"})
+
+    assert "gzip" == response.headers["Content-Encoding"]
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert BODY == response.content
+
+
+def test_middleware_compresses_streams(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert "gzip" == response.headers["Content-Encoding"]
+    assert BODY * 2 == response.content
+
+
+@pytest.mark.parametrize(
+    "path,accept_encoding",
+    [("/small", "gzip"), ("/events", "gzip"), ("/body", "identity")],
+)
+def test_middleware_sends_some_responses_uncompressed(client, path, accept_encoding):
+    response = client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    assert "Content-Encoding" not in response.headers
@@ -0,0 +1,135 @@
+import asyncio
+import copy
+import json
+
+import pytest
+from pydantic import parse_obj_as
+
+
+from bysykkel.app.events import DeltaBroadcaster, station_deltas
+from bysykkel.app.rendering import RenderCache
+from bysykkel.cache import StationSnapshot, build_snapshot
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationCollection, StationStatusReponse
+
+
+@pytest.fixture
+def snapshots(system_status_response, station_feeds):
+    """Two snapshots, where one station's available bikes and docks changed in between."""
+    client = BysykkelClient("http://localhost")
+    info = station_feeds[1]
+    body = system_status_response["body"]
+    changed_body = copy.deepcopy(body)
+    changed_body["last_updated"] += 10
+    changed_body["data"]["stations"][0]["num_bikes_available"] -= 1
+    changed_body["data"]["stations"][0]["num_docks_available"] += 1
+
+    return [
+        build_snapshot(client, parse_obj_as(StationStatusReponse, status), info, 10)
+        for status in (body, changed_body)
+    ]
+
+
+def test_station_deltas_only_include_changed_fields(snapshots):
+    deltas = station_deltas(*snapshots)
+
+    assert [] == deltas["added"]
+    assert [] == deltas["removed"]
+    assert 1 == len(deltas["changed"])
+    assert {
+        "station_id",
+        "last_reported",
+        "num_bikes_available",
+        "num_docks_available",
+    } == set(deltas["changed"][0])
+    assert 6 == deltas["changed"][0]["num_bikes_available"]
+
+
+def test_station_deltas_include_added_and_removed_stations(snapshots):
+    previous, current = snapshots
+    station = current.stations["627"]
+    fewer = StationSnapshot(
+        stations=StationCollection([current.stations["623"]]),
+        last_updated=current.last_updated,
+        ttl=current.ttl,
+    )
+
+    assert [station.__dict__] == station_deltas(fewer, current)["added"]
+    assert ["627"] == station_deltas(current, fewer)["removed"]
+
+
+async def _get_snapshot():
+    raise AssertionError("Not used")
+
+
+@pytest.mark.asyncio
+async def test_deltabroadcaster_sends_snapshot_then_deltas(snapshots):
+    broadcaster = DeltaBroadcaster(_get_snapshot, RenderCache())
+    broadcaster.start = lambda: None
+    broadcaster.publish(snapshots[0])
+
+    events = broadcaster.subscribe(snapshots[0])
+    first = await events.__anext__()
+    broadcaster.publish(snapshots[1])
+    second = await events.__anext__()
+
+    assert first.startswith(b"event: snapshot\n")
+    assert second.startswith(b"event: delta\n")
+    data = json.loads(second.split(b"data: ", 1)[1])
+    assert ["627"] == [station["station_id"] for station in data["changed"]]
+    await events.aclose()
+    assert 0 == broadcaster.subscriber_count
+
+
+@pytest.mark.asyncio
+async def test_deltabroadcaster_drops_slow_subscribers(snapshots):
+    broadcaster = DeltaBroadcaster(_get_snapshot, RenderCache(), queue_size=1)
+    broadcaster.start = lambda: None
+    broadcaster.publish(snapshots[0])
+
+    events = broadcaster.subscribe(snapshots[0])
+    await events.__anext__()
+    for snapshot in (snapshots[1], snapshots[0], snapshots[1]):
+        broadcaster.publish(snapshot)
+
+    assert 0 == broadcaster.subscriber_count
+    with pytest.raises(StopAsyncIteration):
+        await events.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_deltabroadcaster_only_watches_snapshots_while_subscribed(
+    snapshots, monkeypatch
+):
+    calls = []
+
+    async def get_snapshot():
+        calls.append(None)
+        return snapshots[0]
+
+    async def yield_control(times=10):
+        for _ in range(times):
+            await sleep(0)
+
+    # Don't wait for the snapshots to expire
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda seconds: sleep(0))
+    broadcaster = DeltaBroadcaster(get_snapshot, RenderCache())
+
+    events = broadcaster.subscribe(snapshots[0])
+    await events.__anext__()
+    await yield_control()
+    assert calls
+
+    await events.aclose()
+    await yield_control()
+    watched = len(calls)
+    await yield_control()
+    assert watched == len(calls)
+
+    events = broadcaster.subscribe(snapshots[0])
+    await events.__anext__()
+    await yield_control()
+    assert watched < len(calls)
+    await events.aclose()
+    await broadcaster.stop()
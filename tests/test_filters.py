@@ -0,0 +1,65 @@
+import pytest
+
+
+from bysykkel.columns import StationColumns
+from bysykkel.filters import compile_filter
+
+
+@pytest.fixture
+def columns(stations):
+    return StationColumns.from_stations(stations)
+
+
+def station_ids(columns, *expressions):
+    rows = compile_filter(expressions).rows(columns)
+    return {columns["station_id"][row] for row in rows}
+
+
+@pytest.mark.parametrize(
+    "expression,expected",
+    [
+        ("7", {"627"}),
+        ("!=7", {"623"}),
+        (">4", {"627"}),
+        (">=4", {"627", "623"}),
+        ("<7", {"623"}),
+        ("<=7", {"627", "623"}),
+        ("5..7", {"627"}),
+        ("..5", {"623"}),
+        ("4,5,6", {"623"}),
+    ],
+)
+def test_filter_supports_expression(columns, expression, expected):
+    assert expected == station_ids(columns, ("num_bikes_available", expression))
+
+
+def test_filter_combines_conditions(columns):
+    assert {"627"} == station_ids(
+        columns, ("is_renting", "true"), ("capacity", ">=20"), ("lat", "<59.923")
+    )
+
+
+def test_filter_matches_single_stations_like_columns(stations, columns):
+    filter = compile_filter((("num_docks_available", ">6"), ("lon", "10.7..10.8")))
+
+    assert {"623"} == {station.station_id for station in stations if filter(station)}
+    assert {"623"} == {columns["station_id"][row] for row in filter.rows(columns)}
+
+
+@pytest.mark.parametrize(
+    "field,expression",
+    [("num_bikes_available", ">>5"), ("num_bikes_available", ".."), ("name", "x")],
+)
+def test_filter_rejects_unsupported_expression(field, expression):
+    with pytest.raises(ValueError):
+        compile_filter(((field, expression),))
+
+
+def test_filter_checks_given_rows_in_order(columns):
+    filter = compile_filter((("num_bikes_available", ">=4"),))
+    rows = [columns.index["623"], columns.index["627"]]
+
+    assert rows == list(filter.filter_rows(columns, rows))
+    assert [columns.index["627"]] == list(
+        compile_filter((("num_bikes_available", ">4"),)).filter_rows(columns, rows)
+    )
@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+import pytest
+
+
+from bysykkel.cache import StationSnapshot
+from bysykkel.history import HistoryRecorder, HistoryStore
+from bysykkel.models import StationCollection, StationData
+
+
+def _station(station_id: str, time: int, bikes: int) -> StationData:
+    return StationData.construct(
+        station_id=station_id,
+        name=f"Station {station_id}",
+        address=None,
+        lat=59.9,
+        lon=10.7,
+        capacity=20,
+        is_installed=1,
+        is_renting=1,
+        is_returning=1,
+        num_bikes_available=bikes,
+        num_docks_available=20 - bikes,
+        last_reported=datetime.fromtimestamp(time, tz=timezone.utc),
+    )
+
+
+def test_historystore_only_records_changes(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+
+    assert 2 == store.record([_station("1", 0, 5), _station("2", 0, 5)])
+    assert 1 == store.record([_station("1", 10, 5), _station("2", 10, 4)])
+    assert 3 == len(store)
+    store.close()
+
+    # The latest recorded status is loaded again when the store is reopened
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    assert 0 == store.record([_station("1", 20, 5), _station("2", 20, 4)])
+
+
+def test_historystore_queries_time_ranges():
+    store = HistoryStore(":memory:")
+    for time in range(0, 100, 10):
+        store.record([_station("1", time, bikes=time // 10)])
+
+    history = store.history("1", start=25, end=60)
+    assert [20, 30, 40, 50, 60] == [sample.time.timestamp() for sample in history]
+    assert [2, 3, 4, 5, 6] == [sample.num_bikes_available for sample in history]
+
+    # The last sample of every 20 seconds after the start
+    history = store.history("1", start=25, end=90, resolution=20)
+    assert [20, 40, 60, 80, 90] == [sample.time.timestamp() for sample in history]
+
+    assert [] == store.history("2", start=0, end=100)
+
+
+def test_historystore_maintains_hourly_rollups():
+    store = HistoryStore(":memory:", max_gap=300)
+    # Monday 1970-01-05 08:00 UTC
+    monday = 4 * 24 * 3600 + 8 * 3600
+    store.record([_station("1", monday, bikes=0)], monday)
+    store.record([_station("1", monday + 60, bikes=4)], monday + 60)
+    store.record([_station("1", monday + 180, bikes=4)], monday + 180)
+    # Gaps longer than `max_gap` aren't counted
+    store.record([_station("1", monday + 3000, bikes=2)], monday + 3000)
+
+    (rollup,) = store.rollups("1")
+    assert (0, 8) == (rollup.weekday, rollup.hour)
+    assert 3 == rollup.observed_minutes
+    assert 1 == rollup.empty_minutes
+    assert 0 == rollup.full_minutes
+    assert (0, 4) == (rollup.min_bikes, rollup.max_bikes)
+    assert pytest.approx(8 / 3) == rollup.mean_bikes
+
+    assert [rollup] == store.rollups("1", weekday=0, hour=8)
+    assert [] == store.rollups("1", hour=9)
+
+
+@pytest.mark.asyncio
+async def test_historyrecorder_records_each_snapshot_once():
+    store = HistoryStore(":memory:")
+    stations = StationCollection([_station("1", 0, 5)])
+    snapshot = StationSnapshot(stations, stations["1"].last_reported, ttl=10)
+
+    async def get_snapshot():
+        return snapshot
+
+    recorder = HistoryRecorder(store, get_snapshot)
+
+    assert 1 == await recorder.record(snapshot)
+    assert 0 == await recorder.record(snapshot)
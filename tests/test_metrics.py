@@ -0,0 +1,58 @@
+import pytest
+from prometheus_client import CollectorRegistry
+
+
+from bysykkel import metrics
+from bysykkel.app.main import observe_stream
+from bysykkel.cache import SnapshotCache
+from bysykkel.client import BysykkelClient
+
+
+@pytest.fixture
+def registry():
+    registry = CollectorRegistry()
+    metrics.enable(registry)
+    yield registry
+    metrics.disable()
+
+
+@pytest.mark.asyncio
+async def test_metrics_record_upstream_fetches_and_cache_lookups(
+    station_routes, registry
+):
+    cache = SnapshotCache(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+
+    await cache.get()
+    await cache.get()
+
+    def sample(name, **labels):
+        return registry.get_sample_value(name, labels)
+
+    assert 1 == sample(
+        "bysykkel_upstream_fetches_total", feed="station_status", result="updated"
+    )
+    assert 1 == sample("bysykkel_upstream_fetch_seconds_count", feed="station_status")
+    assert 0 < sample("bysykkel_upstream_response_bytes_sum", feed="station_status")
+    assert 1 == sample("bysykkel_merge_seconds_count")
+    assert 1 == sample("bysykkel_snapshot_cache_requests_total", result="miss")
+    assert 1 == sample("bysykkel_snapshot_cache_requests_total", result="hit")
+    assert b"bysykkel_parse_seconds" in metrics.render()[0]
+
+
+def test_observe_stream_records_once_the_stream_is_consumed(registry):
+    def sample(name):
+        return registry.get_sample_value(
+            name, {"route": "stations", "stage": "filter_render"}
+        )
+
+    stream = observe_stream("stations", "filter_render", iter([b"a\n", b"bc\n"]))
+    assert b"a\n" == next(stream)
+    assert sample("bysykkel_request_stage_seconds_count") is None
+
+    assert [b"bc\n"] == list(stream)
+    assert 1 == sample("bysykkel_request_stage_seconds_count")
+    assert 5 == registry.get_sample_value(
+        "bysykkel_response_bytes_sum", {"route": "stations"}
+    )
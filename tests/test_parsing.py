@@ -0,0 +1,42 @@
+import pydantic
+import pytest
+from pydantic import parse_obj_as
+
+
+from bysykkel.models import StationInfoResponse, StationStatusReponse
+from bysykkel.parsing import parse_station_information, parse_station_status
+
+
+def test_parse_station_information_matches_pydantic(system_information_response):
+    body = system_information_response["body"]
+
+    assert parse_obj_as(StationInfoResponse, body) == parse_station_information(body)
+
+
+def test_parse_station_status_matches_pydantic(system_status_response):
+    body = system_status_response["body"]
+
+    assert parse_obj_as(StationStatusReponse, body) == parse_station_status(body)
+
+
+def test_parse_station_status_raises_validation_error_on_invalid_payload(
+    system_status_response,
+):
+    body = system_status_response["body"]
+    invalid_station = {**body["data"]["stations"][0], "num_bikes_available": "many"}
+    invalid_body = {**body, "data": {"stations": [invalid_station]}}
+
+    with pytest.raises(pydantic.ValidationError):
+        parse_station_status(invalid_body)
+
+
+@pytest.mark.parametrize("field", ["station_id", "name"])
+def test_parse_station_information_raises_validation_error_on_null_field(
+    system_information_response, field
+):
+    body = system_information_response["body"]
+    invalid_station = {**body["data"]["stations"][0], field: None}
+    invalid_body = {**body, "data": {"stations": [invalid_station]}}
+
+    with pytest.raises(pydantic.ValidationError):
+        parse_station_information(invalid_body)
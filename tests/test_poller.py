@@ -0,0 +1,36 @@
+import pytest
+
+
+from bysykkel.cache import SnapshotUnavailableError
+from bysykkel.client import BysykkelClient
+from bysykkel.poller import StationPoller
+
+
+@pytest.mark.asyncio
+async def test_stationpoller_is_not_ready_before_first_poll(station_routes):
+    poller = StationPoller(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no")
+    )
+
+    assert not poller.is_ready
+    with pytest.raises(SnapshotUnavailableError):
+        await poller.get()
+
+
+@pytest.mark.asyncio
+async def test_stationpoller_polls_station_info_less_often_than_status(station_routes):
+    status_route, info_route = station_routes
+    poller = StationPoller(
+        BysykkelClient("https://gbfs.urbansharing.com/oslobysykkel.no"),
+        info_interval=300,
+    )
+
+    first = await poller.poll()
+    second = await poller.poll()
+
+    assert poller.is_ready
+    assert second is await poller.get()
+    assert first is not second
+    assert 2 == len(second.stations)
+    assert 2 == status_route.call_count
+    assert 1 == info_route.call_count
@@ -0,0 +1,106 @@
+import gzip
+import json
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+
+from bysykkel.app.rendering import (
+    RenderCache,
+    render_columnar,
+    render_msgpack,
+    render_ndjson,
+    render_stations,
+)
+from bysykkel.models import PartialStationData
+
+
+@pytest.mark.parametrize("fields", [None, frozenset({"station_id", "last_reported"})])
+def test_render_stations_matches_response_model(stations, fields):
+    expected = [
+        PartialStationData(
+            **{k: v for k, v in station.dict().items() if fields is None or k in fields}
+        )
+        for station in stations
+    ]
+
+    assert jsonable_encoder(expected, exclude_defaults=True) == json.loads(
+        render_stations(stations, fields)
+    )
+
+
+def test_rendercache_renders_once_per_station_collection(stations):
+    cache = RenderCache()
+
+    rendered = cache.get(stations)
+
+    assert rendered is cache.get(stations)
+    assert rendered.matches(rendered.etag)
+    assert rendered.matches(f'W/{rendered.etag}, "other"')
+    assert not rendered.matches('"other"')
+    content, encoding = rendered.encode("deflate, gzip;q=0.5")
+    assert "gzip" == encoding
+    assert rendered.content == gzip.decompress(content)
+    assert (rendered.content, None) == rendered.encode("gzip;q=0")
+
+
+def test_renderedbody_has_an_etag_per_content_coding(stations):
+    rendered = RenderCache().get(stations)
+
+    gzip_etag = rendered.variant_etag("gzip")
+
+    assert rendered.etag == rendered.variant_etag("identity")
+    assert rendered.etag[:-1] + '-gzip"' == gzip_etag
+    assert rendered.matches(gzip_etag)
+    assert rendered.matches(f"W/{gzip_etag}")
+
+
+def test_render_ndjson_renders_one_station_per_line(stations):
+    content = b"".join(render_ndjson(stations, frozenset({"station_id"}), chunk_size=1))
+
+    assert [{"station_id": station.station_id} for station in stations] == [
+        json.loads(line) for line in content.splitlines()
+    ]
+
+
+def test_render_ndjson_consumes_stations_lazily(stations):
+    consumed = []
+
+    def station_iterator():
+        for station in stations:
+            consumed.append(station)
+            yield station
+
+    chunks = render_ndjson(station_iterator(), chunk_size=1)
+
+    next(chunks)
+    assert 1 == len(consumed)
+
+
+def test_render_columnar_renders_a_list_per_field(stations):
+    rows = json.loads(render_stations(stations))
+
+    columns = json.loads(render_columnar(stations))
+
+    assert [row["station_id"] for row in rows] == columns["station_id"]
+    assert [row["last_reported"] for row in rows] == columns["last_reported"]
+    assert {"station_id": [station.station_id for station in stations]} == json.loads(
+        render_columnar(stations, frozenset({"station_id"}))
+    )
+
+
+def test_render_msgpack_matches_json(stations):
+    msgpack = pytest.importorskip("msgpack")
+
+    assert json.loads(render_stations(stations)) == msgpack.unpackb(
+        render_msgpack(stations)
+    )
+
+
+def test_rendercache_renders_once_per_format(stations):
+    cache = RenderCache()
+
+    columnar = cache.get(stations, format="columnar")
+
+    assert columnar is cache.get(stations, format="columnar")
+    assert columnar.content != cache.get(stations).content
@@ -0,0 +1,222 @@
+import json
+
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+
+from bysykkel.app import main
+from bysykkel.history import HistoryStore
+
+# Next to station 623 of the example responses
+NEAR_623 = "lat=59.915&lon=10.731"
+
+
+@pytest.fixture
+def client(station_routes, monkeypatch):
+    """Client of the app, where every test starts without a cached snapshot of the example responses.
+
+    The example responses are also served as `othersystem`, on the `/v1/othersystem/...` routes.
+    """
+    respx.route(host="testserver").pass_through()
+    url = main.settings.oslobysykkel_apiurl
+    systems = {
+        name: main.StationSystem.from_url(name, url)
+        for name in (main.settings.default_system, "othersystem")
+    }
+    monkeypatch.setattr(main, "systems", systems)
+    return TestClient(main.app)
+
+
+def station_ids(response):
+    assert 200 == response.status_code, response.text
+    return [station["station_id"] for station in response.json()]
+
+
+def test_stations_route_filters_by_bounding_box(client):
+    assert ["623"] == station_ids(client.get("/v1/stations?bbox=10.7,59.9,10.8,59.92"))
+
+
+@pytest.mark.parametrize(
+    "bbox", ["nan,nan,nan,nan", "10,59,inf,60", "11,59,10,60", "10,59,60"]
+)
+def test_stations_route_rejects_invalid_bounding_box(client, bbox):
+    # Load the snapshot first, so the example responses are queried
+    client.get("/v1/stations")
+
+    assert 400 == client.get(f"/v1/stations?bbox={bbox}").status_code
+
+
+def test_nearest_route_orders_stations_by_distance(client):
+    response = client.get(f"/v1/stations/nearest?{NEAR_623}&k=2")
+
+    assert ["623", "627"] == station_ids(response)
+    assert response.json()[0]["distance"] < response.json()[1]["distance"]
+    assert ["627"] == station_ids(
+        client.get(f"/v1/stations/nearest?{NEAR_623}&min_bikes=5")
+    )
+
+
+def test_nearest_route_finds_stations_far_away(client):
+    response = client.get("/v1/stations/nearest?lat=0&lon=0&k=1")
+
+    assert ["623"] == station_ids(response)
+    assert 6_000_000 < response.json()[0]["distance"]
+
+
+@pytest.mark.parametrize(
+    "query", ["lat=nan&lon=0", "lat=0&lon=inf", "lat=91&lon=0", f"{NEAR_623}&k=0"]
+)
+def test_nearest_route_rejects_invalid_query(client, query):
+    client.get("/v1/stations")
+
+    assert 422 == client.get(f"/v1/stations/nearest?{query}").status_code
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("num_bikes_available=>5", ["627"]),
+        ("num_docks_available=5..8&is_renting=true", ["623", "627"]),
+        ("capacity=<20", ["623"]),
+    ],
+)
+def test_stations_route_filters_stations(client, query, expected):
+    assert expected == station_ids(client.get(f"/v1/stations?{query}"))
+
+
+def test_stations_route_rejects_unsupported_filter(client):
+    client.get("/v1/stations")
+
+    assert 400 == client.get("/v1/stations?capacity=>>5").status_code
+
+
+def test_stations_route_lists_merged_stations(client):
+    assert ["623", "627"] == station_ids(client.get("/v1/stations"))
+
+
+def test_stations_route_responds_304_if_not_modified(client):
+    response = client.get("/v1/stations", headers={"Accept-Encoding": "gzip"})
+    etag = response.headers["ETag"]
+
+    # Any content coding of the same body matches
+    for accept_encoding in ("gzip", "identity"):
+        not_modified = client.get(
+            "/v1/stations",
+            headers={"If-None-Match": etag, "Accept-Encoding": accept_encoding},
+        )
+        assert 304 == not_modified.status_code
+        assert b"" == not_modified.content
+    modified = client.get("/v1/stations", headers={"If-None-Match": '"other"'})
+    assert 200 == modified.status_code
+
+
+def test_stations_route_streams_ndjson(client):
+    response = client.get(
+        "/v1/stations?fields=station_id", headers={"Accept": "application/x-ndjson"}
+    )
+
+    assert 200 == response.status_code
+    assert response.headers["Content-Type"].startswith("application/x-ndjson")
+    assert [{"station_id": "623"}, {"station_id": "627"}] == [
+        json.loads(line) for line in response.text.splitlines()
+    ]
+    limited = client.get("/v1/stations?format=ndjson&limit=1")
+    assert 1 == len(limited.text.splitlines())
+
+
+@pytest.mark.parametrize(
+    "query,expected", [("limit=1", ["623"]), ("limit=0", ["623", "627"])]
+)
+def test_stations_route_limits_stations(client, query, expected):
+    assert expected == station_ids(client.get(f"/v1/stations?{query}"))
+
+
+def test_stations_route_rejects_negative_limit(client):
+    client.get("/v1/stations")
+
+    assert 422 == client.get("/v1/stations?limit=-1").status_code
+
+
+@pytest.fixture
+def history_store(monkeypatch, stations):
+    """History of the example stations, recorded a minute apart."""
+    store = HistoryStore(":memory:")
+    monkeypatch.setattr(main, "history_store", store)
+    time = stations["627"].last_reported.timestamp()
+    store.record(stations, time)
+    store.record(stations, time + 60)
+    yield store
+    store.close()
+
+
+def test_history_route_serves_recorded_history(client, history_store, stations):
+    time = stations["627"].last_reported.timestamp()
+
+    history = client.get(f"/v1/station/627/history?from={time}&to={time + 60}")
+
+    assert 200 == history.status_code
+    assert [7] == [sample["num_bikes_available"] for sample in history.json()]
+    assert 400 == client.get(f"/v1/station/627/history?from={time}&to=0").status_code
+
+
+def test_history_route_responds_404_if_disabled(client, monkeypatch):
+    monkeypatch.setattr(main, "history_store", None)
+
+    assert 404 == client.get("/v1/station/627/history").status_code
+
+
+def test_rollups_route_serves_recorded_rollups(client, history_store):
+    rollups = client.get("/v1/station/627/rollups")
+
+    assert 200 == rollups.status_code
+    assert [(7, 1)] == [
+        (rollup["max_bikes"], rollup["observed_minutes"]) for rollup in rollups.json()
+    ]
+    assert 422 == client.get("/v1/station/627/rollups?weekday=7").status_code
+
+
+def test_rollups_route_responds_404_if_disabled(client, monkeypatch):
+    monkeypatch.setattr(main, "history_store", None)
+
+    assert 404 == client.get("/v1/station/627/rollups").status_code
+
+
+def test_station_routes_are_served_per_system(client):
+    assert ["623", "627"] == station_ids(client.get("/v1/othersystem/stations"))
+    assert ["623"] == station_ids(
+        client.get(f"/v1/othersystem/stations/nearest?{NEAR_623}&k=1")
+    )
+    assert "627" == client.get("/v1/othersystem/station/627").json()["station_id"]
+    assert 404 == client.get("/v1/unknown/stations").status_code
+
+
+@pytest.mark.parametrize(
+    "ids,expected",
+    [("627,unknown,623", ["627", "623"]), ("623,623", ["623"]), ("unknown", [])],
+)
+def test_stations_route_looks_up_stations_by_id(client, ids, expected):
+    assert expected == station_ids(client.get(f"/v1/stations?ids={ids}"))
+
+
+def test_stations_route_limits_stations_looked_up_by_id(client):
+    assert ["627"] == station_ids(client.get("/v1/stations?ids=627,623&limit=1"))
+    assert 422 == client.get("/v1/stations?ids=623,627&limit=-2").status_code
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("sort=-num_bikes_available", ["627", "623"]),
+        ("sort=num_bikes_available&offset=1", ["627"]),
+        ("sort=-num_docks_available&limit=1", ["623"]),
+        ("sort=name&fields=station_id", ["623", "627"]),
+        ("sort=-capacity&ids=623,627", ["627", "623"]),
+    ],
+)
+def test_stations_route_sorts_stations(client, query, expected):
+    assert expected == station_ids(client.get(f"/v1/stations?{query}"))
+
+
+def test_stations_route_rejects_unsupported_sort(client):
+    assert 400 == client.get("/v1/stations?sort=unknown").status_code
@@ -0,0 +1,59 @@
+import copy
+
+import pytest
+from pydantic import parse_obj_as
+
+
+from bysykkel.cache import SnapshotUnavailableError, build_snapshot
+from bysykkel.client import BysykkelClient
+from bysykkel.models import StationStatusReponse
+from bysykkel.shared import SharedSnapshotReader, SnapshotWriter
+
+
+@pytest.mark.asyncio
+async def test_sharedsnapshotreader_loads_published_snapshots(tmp_path, station_feeds):
+    client = BysykkelClient("http://localhost")
+    path = str(tmp_path / "oslobysykkel.json")
+    reader = SharedSnapshotReader(client, path, check_interval=0)
+
+    assert not reader.is_ready
+    with pytest.raises(SnapshotUnavailableError):
+        await reader.get()
+
+    published = build_snapshot(client, *station_feeds, default_ttl=10)
+    SnapshotWriter(path).write(published)
+    snapshot = await reader.get()
+
+    assert reader.is_ready
+    assert set(published.stations.ids()) == set(snapshot.stations.ids())
+    assert published.last_updated == snapshot.last_updated
+    assert snapshot.is_fresh
+
+
+@pytest.mark.asyncio
+async def test_sharedsnapshotreader_reuses_unchanged_feeds(
+    tmp_path, station_feeds, system_status_response
+):
+    client = BysykkelClient("http://localhost")
+    path = str(tmp_path / "oslobysykkel.json")
+    reader = SharedSnapshotReader(client, path, check_interval=0)
+    writer = SnapshotWriter(path)
+
+    first = build_snapshot(client, *station_feeds, default_ttl=10)
+    writer.write(first)
+    loaded = await reader.get()
+    writer.write(first)
+    assert (await reader.get()).stations is loaded.stations
+
+    body = copy.deepcopy(system_status_response["body"])
+    body["last_updated"] += 10
+    body["data"]["stations"][0]["num_bikes_available"] = 0
+    status = parse_obj_as(StationStatusReponse, body)
+    writer.write(build_snapshot(client, status, station_feeds[1], 10, previous=first))
+    changed = await reader.get()
+
+    assert changed.stations is not loaded.stations
+    assert 0 == changed.stations["627"].num_bikes_available
+    # The station info is unchanged, so its spatial index is reused
+    assert changed.info is loaded.info
+    assert changed.spatial is loaded.spatial
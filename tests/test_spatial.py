@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+
+from bysykkel.spatial import GridIndex, distance
+
+
+@pytest.fixture
+def stations():
+    rng = random.Random(1)
+    return [
+        (str(i), 59.85 + rng.random() * 0.15, 10.6 + rng.random() * 0.3)
+        for i in range(500)
+    ]
+
+
+def test_distance_between_oslo_and_bergen():
+    assert 300_000 < distance(59.91, 10.75, 60.39, 5.32) < 310_000
+
+
+@pytest.mark.parametrize("lat,lon,k", [(59.91, 10.75, 1), (59.8, 10.5, 10)])
+def test_gridindex_finds_nearest_stations(stations, lat, lon, k):
+    index = GridIndex(stations)
+
+    expected = sorted(stations, key=lambda s: distance(lat, lon, s[1], s[2]))[:k]
+    nearest = index.nearest(lat, lon, k)
+
+    assert [station_id for station_id, _, _ in expected] == [
+        station_id for station_id, _ in nearest
+    ]
+
+
+def test_gridindex_only_finds_accepted_stations(stations):
+    index = GridIndex(stations)
+
+    nearest = index.nearest(59.91, 10.75, 5, accept=lambda id: int(id) % 7 == 0)
+
+    assert 5 == len(nearest)
+    assert all(int(station_id) % 7 == 0 for station_id, _ in nearest)
+
+
+def test_gridindex_finds_stations_within_bounding_box(stations):
+    index = GridIndex(stations)
+    min_lat, min_lon, max_lat, max_lon = 59.9, 10.7, 59.95, 10.8
+
+    expected = {
+        station_id
+        for station_id, lat, lon in stations
+        if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+    }
+
+    assert expected == set(index.within(min_lat, min_lon, max_lat, max_lon))
+
+
+def test_gridindex_finds_nearest_stations_far_away(stations):
+    index = GridIndex(stations)
+
+    expected = min(stations, key=lambda s: distance(0, 0, s[1], s[2]))
+    nearest = index.nearest(0, 0, 1)
+
+    assert [expected[0]] == [station_id for station_id, _ in nearest]